@@ -31,6 +31,7 @@ WiFiUDP udp;
 WiFiServer tcpServer(3001);
 
 volatile bool isPlaying = false;
+volatile bool listenWhilePlaying = false; // keep streaming mic audio during playback so the server can detect the user interrupting
 uint32_t mic_timeout = 0;
 
 // LED globals that are set then ramped down by updateLedTask to create pulse effect
@@ -330,7 +331,7 @@ void loop()
         header[1:2] mic timeout in seconds (after audio is done playing)
         header[3]   volume
         header[4]   fade rate of LED's VAD visualization
-        header[5]   not used
+        header[5]   flags, bit 0 keeps the mic streaming during playback (barge-in)
         */
         if (header[0] == 0xAA)
         {
@@ -347,6 +348,7 @@ void loop()
                 volume = 20;
             }
 
+            listenWhilePlaying = header[5] & 0x01;
             isPlaying = true;
 
             bool initialBufferFilled = false; // get a nice reservoir loaded into wavData to try avoid jitter
@@ -357,8 +359,39 @@ void loop()
             int16_t sample16;
             uint32_t sum = 0; // for calculating average for LEDs
 
+            bool stopped = false; // set by a stop playback command (0xEE) from the server, e.g. when the user interrupts
+
             while (client.connected())
             {
+                /*
+                header[0]   0xEE for stop playback command, sent on a new connection while audio is playing
+                header[1:2] mic timeout in seconds
+                header[3:5] not used
+                Other commands arriving during playback are dropped
+                */
+                if (tcpServer.hasClient())
+                {
+                    WiFiClient ctrlClient = tcpServer.available();
+                    uint32_t ctrlTic = millis();
+                    while (ctrlClient.available() < 6 && millis() - ctrlTic < 100)
+                    {
+                        delay(1);
+                    }
+                    uint8_t ctrlHeader[6] = {0};
+                    if (ctrlClient.available() >= 6)
+                    {
+                        ctrlClient.read(ctrlHeader, 6);
+                    }
+                    ctrlClient.stop();
+                    if (ctrlHeader[0] == 0xEE)
+                    {
+                        Serial.println("Received stop playback command (0xEE)");
+                        timeout = ctrlHeader[1] << 8 | ctrlHeader[2];
+                        stopped = true;
+                        break;
+                    }
+                }
+
                 bytesAvailable = client.available();
 
                 if (bytesAvailable >= 2)
@@ -415,13 +448,21 @@ void loop()
                 }
             }
 
-            // Hack to fill buffers with silence and block till all real audio is flushed out
-            uint32_t silenceBuffer[240];
-            memset(silenceBuffer, 0, sizeof(silenceBuffer));
-            for (int i = 0; i < 8; i++)
+            if (stopped)
+            {
+                client.stop();
+                i2s_zero_dma_buffer(I2S_NUM); // drop queued audio immediately
+            }
+            else
             {
-                size_t bytesWritten = 0;
-                i2s_write(I2S_NUM, silenceBuffer, sizeof(silenceBuffer), &bytesWritten, portMAX_DELAY);
+                // Hack to fill buffers with silence and block till all real audio is flushed out
+                uint32_t silenceBuffer[240];
+                memset(silenceBuffer, 0, sizeof(silenceBuffer));
+                for (int i = 0; i < 8; i++)
+                {
+                    size_t bytesWritten = 0;
+                    i2s_write(I2S_NUM, silenceBuffer, sizeof(silenceBuffer), &bytesWritten, portMAX_DELAY);
+                }
             }
 
             isPlaying = false;
@@ -480,10 +521,22 @@ void loop()
         {
             Serial.println("Received mic timeout command (0xDD)");
             uint16_t timeout = header[1] << 8 | header[2];
-            mic_timeout = millis() + timeout;
+            mic_timeout = millis() + timeout * 1000;
             setLed(0, 255, 50, 100, 5); // TODO add better thinking animation - currently just green pulse to indicate transcribe is done
             client.stop();
         }
+        /*
+        header[0]   0xEE for stop playback command - when nothing is playing only the mic timeout applies
+        header[1:2] mic timeout in seconds
+        header[3:5] not used
+        */
+        else if (header[0] == 0xEE)
+        {
+            Serial.println("Received stop playback command (0xEE) while idle");
+            uint16_t timeout = header[1] << 8 | header[2];
+            mic_timeout = millis() + timeout * 1000;
+            client.stop();
+        }
         else
         {
             Serial.println("Received unknown command");
@@ -527,11 +580,11 @@ void micTask(void *pvParameters)
     while (1)
     {
         bool currentState = false;
-        if (isPlaying || mute) // don't listen while playing audio or muted
+        if ((isPlaying && !listenWhilePlaying) || mute) // don't listen while playing audio (unless asked to) or muted
             ;
         else if (serverIP == IPAddress(0, 0, 0, 0)) // no server greeted us yet, so nowhere to send data
             ;
-        else if (mic_timeout < millis()) // alotted time for speaking has passed
+        else if (!isPlaying && mic_timeout < millis()) // alotted time for speaking has passed, mic timeout starts after playback
         {
             if (prevState)
             {
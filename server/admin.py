@@ -0,0 +1,162 @@
+import json
+import threading
+import traceback
+from concurrent.futures import TimeoutError as NotReadyError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rich import print
+
+import profiler
+
+# Local admin API, e.g.
+#   curl localhost:3020/devices
+#   curl localhost:3020/stats
+#   curl -X POST localhost:3020/config -d '{"vad.start_ratio": 0.4, "transcribe.whisper_model": "small.en"}'
+#   curl -X POST localhost:3020/devices/onju-coral -d '{"voice": "Samantha"}'
+#   curl -X POST localhost:3020/export -d '{"file": "devices_backup.json"}'
+#   curl -X POST localhost:3020/profile -d '{"seconds": 5}'
+#   curl -X POST localhost:3020/timers -d '{"enabled": true}'
+
+class AdminServer:
+    def __init__(self, config, manager, queue, startup, config_updater, sampling_profiler):
+        self.config = config
+        self.manager = manager
+        self.queue = queue
+        self.startup = startup
+        self.config_updater = config_updater
+        self.profiler = sampling_profiler
+
+    def serve(self, port):
+        admin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.dispatch('GET')
+
+            def do_POST(self):
+                self.dispatch('POST')
+
+            def dispatch(self, method):
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    body = json.loads(self.rfile.read(length)) if length else {}
+                    status, result = admin.route(method, self.path.rstrip('/'), body)
+                except (KeyError, ValueError, TypeError) as e:
+                    status, result = 400, {'error': str(e)}
+                except NotReadyError:
+                    status, result = 503, {'error': "Server is still starting"}
+                except Exception:
+                    status, result = 500, {'error': traceback.format_exc()}
+                payload = json.dumps(result, indent=2, default=str).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass # keep the console for device logs
+
+        server = ThreadingHTTPServer((self.config['admin']['ip'], port), Handler)
+        print(f"\n🛠️  Admin API on http://{server.server_address[0]}:{server.server_address[1]}")
+        threading.Thread(target=server.serve_forever, daemon=True, name="admin").start()
+        return server
+
+    def route(self, method, path, body):
+        parts = path.strip('/').split('/')
+        if method == 'GET' and path == '/devices':
+            return 200, [self.device_info(d) for d in self.manager.devices.values()]
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        if method == 'GET' and path == '/config':
+            return 200, self.config
+        if method == 'POST' and path == '/config':
+            return 200, self.update_config(body)
+        if method == 'POST' and parts[0] == 'devices' and len(parts) == 2:
+            return self.update_device(parts[1], body)
+        if method == 'POST' and path == '/export':
+            return 200, self.manager.save_to_json(body.get('file'))
+        if method == 'POST' and path == '/profile':
+            started = self.profiler.start(body.get('seconds'))
+            return (200, {'started': True}) if started else (409, {'error': "Profiler already running"})
+        if method == 'POST' and path == '/timers':
+            if body.get('reset'):
+                profiler.timer_stats(reset=True)
+            profiler.set_timers(bool(body['enabled']))
+            return 200, {'enabled': profiler.timers_enabled}
+        return 404, {'error': f"No route for {method} {path}"}
+
+    def device_info(self, device):
+        return {
+            'hostname': device.hostname,
+            'ip_address': device.ip_address,
+            'voice': device.voice,
+            'messages': None if device._messages is None else len(device._messages) - 1,
+            'history_tokens': None if device._messages is None else device.history_tokens(),
+            'recording': device.vad.recording,
+            'responding': bool(device.job and device.job.is_active()),
+            'noise_floor': round(float(device.vad.noise_floor), 1),
+            'pregate_skipped_frames': device.vad.skipped_frames,
+        }
+
+    def stats(self):
+        whisper = self.startup.get('whisper') if self.startup.is_ready('whisper') else None
+        return {
+            'ready': self.startup.is_ready(),
+            'failed': self.startup.failures,
+            'startup_timeline': self.startup.timeline,
+            'transcribe_queue': self.queue.qsize(),
+            'devices': len(self.manager.devices),
+            'playbacks': list(self.manager.downlink.active),
+            'whisper_model': whisper.name if whisper else None,
+            'whisper_loading': whisper.loading if whisper else None,
+            'timers_enabled': profiler.timers_enabled,
+            'timers': profiler.timer_stats(),
+        }
+
+    def update_config(self, body):
+        # everything is validated before anything is applied, so a bad value leaves the config as it was
+        model = body.get('transcribe.whisper_model')
+        if 'transcribe.whisper_model' in body and not isinstance(model, str):
+            raise TypeError("transcribe.whisper_model should be a str")
+        updates = {p: v for p, v in body.items() if p != 'transcribe.whisper_model'}
+        validated = self.config_updater.validate_all(updates)
+        voice = updates.get('elevenlabs_default_voice')
+        if 'elevenlabs_default_voice' in updates and voice not in self.startup.get('tts', timeout=0).voices:
+            raise ValueError(f"Unknown voice: {voice}") # used as the fallback for devices' voices, so it has to exist
+        if model:
+            self.startup.get('whisper', timeout=0).swap(model) # loads in the background, switches once loaded
+        self.config_updater.apply(validated)
+        applied = {path: value for path, (_, _, value) in zip(updates, validated)}
+        if model:
+            applied['transcribe.whisper_model'] = model
+
+        if any(p.startswith('vad.') for p in body):
+            for device in list(self.manager.devices.values()):
+                device.vad.resize()
+        if any(p.startswith('llm.') or p.startswith('use_') for p in body):
+            if any(p.startswith('use_') for p in body):
+                llm = self.startup.get('llm', timeout=0)
+                llm.functions = llm.setup_functions()
+            for device in list(self.manager.devices.values()):
+                device.refresh_system_prompt()
+        print(f"🔥 Admin API updated config: {applied}")
+        return {'applied': applied}
+
+    def update_device(self, hostname, body):
+        device = self.manager.devices.get(hostname)
+        if device is None:
+            return 404, {'error': f"No device {hostname}"}
+        for key, value in body.items():
+            if key == 'voice':
+                device.voice = value
+            elif key == 'ip_address':
+                device.ip_address = value
+            elif key == 'clear_history':
+                if value:
+                    device.truncate_messages(1)
+            else:
+                raise KeyError(f"Unknown device field {key}")
+        device.save()
+        device.log.info(f"Updated from admin API: {body}")
+        return 200, self.device_info(device)
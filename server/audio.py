@@ -0,0 +1,88 @@
+import functools
+import os
+import subprocess
+import wave
+from math import gcd
+
+import numpy as np
+
+# In-process audio conversion for what's sent to devices (16-bit mono PCM at the playback rate).
+# ffmpeg is only spawned to decode compressed formats such as mp3.
+
+def read_wav(fname):
+    """Returns (float32 samples in [-1, 1] shaped (n, channels), sample rate)."""
+    try:
+        with wave.open(fname, 'rb') as f:
+            rate, channels, width = f.getframerate(), f.getnchannels(), f.getsampwidth()
+            raw = f.readframes(f.getnframes())
+    except wave.Error:
+        from scipy.io import wavfile # float & other WAV formats the wave module doesn't handle
+        rate, data = wavfile.read(fname)
+        data = data.reshape(len(data), -1)
+        if data.dtype.kind == 'f':
+            return data.astype(np.float32), rate
+        return data.astype(np.float32) / float(np.iinfo(data.dtype).max + 1), rate
+
+    if width == 1: # 8-bit WAV is unsigned
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3: # 24-bit, pad to 32-bit
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        data = (b[:, 0].astype(np.int32) << 8 | b[:, 1].astype(np.int32) << 16 | b[:, 2].astype(np.int32) << 24)
+        data = data.astype(np.float32) / 2**31
+    else:
+        dtype = {2: np.int16, 4: np.int32}[width]
+        data = np.frombuffer(raw, dtype=dtype).astype(np.float32) / float(np.iinfo(dtype).max + 1)
+    return data.reshape(-1, channels), rate
+
+def write_wav(fname, pcm, rate):
+    with wave.open(fname, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm)
+
+def to_mono(data):
+    return data.mean(axis=1) if data.ndim > 1 else data
+
+def resample(data, rate_in, rate_out):
+    if rate_in == rate_out:
+        return data
+    from scipy.signal import resample_poly
+
+    g = gcd(int(rate_in), int(rate_out))
+    return resample_poly(data, rate_out // g, rate_in // g).astype(np.float32)
+
+def to_int16(data):
+    return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+
+def decode_ffmpeg(fname, rate):
+    # one ffmpeg call straight to mono int16 at the target rate
+    out = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', fname, '-f', 's16le', '-ac', '1', '-ar', str(rate), '-'],
+        capture_output=True,
+        check=True,
+    )
+    return out.stdout
+
+def load_pcm(fname, rate, cache=False):
+    """Raw 16-bit mono PCM at `rate` for any audio file, cached in memory for static files like the greeting."""
+    if cache:
+        stat = os.stat(fname)
+        return _load_pcm_cached(fname, rate, stat.st_mtime_ns, stat.st_size)
+    return _load_pcm(fname, rate)
+
+def _load_pcm(fname, rate):
+    if not fname.lower().endswith('.wav'):
+        return decode_ffmpeg(fname, rate)
+    try:
+        with wave.open(fname, 'rb') as f:
+            if (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (1, 2, rate): # already in device format
+                return f.readframes(f.getnframes())
+    except wave.Error:
+        pass
+    data, rate_in = read_wav(fname)
+    return to_int16(resample(to_mono(data), rate_in, rate)).tobytes()
+
+@functools.lru_cache(maxsize=32)
+def _load_pcm_cached(fname, rate, mtime_ns, size):
+    return _load_pcm(fname, rate)
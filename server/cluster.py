@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+from rich import print
+
+from store import StateStore
+
+# Sharding devices across worker processes/hosts:
+# - the frontend receives multicast announcements & UDP audio, and forwards each device's audio to its worker
+#   prefixed with the device's IPv4 address (4 bytes)
+# - workers heartbeat to the frontend's control port, and are replied to with the devices they own ({hostname: ip})
+# - devices are assigned by rendezvous hashing of hostname over live workers, so when a worker dies or joins only
+#   the devices it owned/gains move, and conversation state is picked up from the shared store (`state_db`). The store is
+#   SQLite in WAL mode, which can't be shared over a network filesystem, so this only holds for workers on the same host
+# - a worker contacts each device it gains over TCP, as devices stream audio to whichever host last connected to them
+
+def owner(hostname, workers):
+    return max(workers, key=lambda w: hashlib.sha1(f"{w}:{hostname}".encode()).digest()) if workers else None
+
+class Frontend:
+    def __init__(self, config, overrides=None):
+        self.config = config
+        self.overrides = overrides or {} # command line arguments, passed on to local workers
+        self.cluster = config['cluster']
+        self.workers = {} # worker id "ip:port" -> last heartbeat time
+        self.devices = {} # hostname -> ip
+        self.hostnames = {} # ip -> hostname
+        self.assignments = {} # hostname -> worker id
+        self.lock = threading.Lock()
+        self.control = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.control.bind(("", self.cluster['control_port']))
+        self.processes = []
+        # devices known from before a restart are assigned as soon as workers are up, without waiting for announcements
+        store = StateStore(config)
+        try:
+            if store.is_empty() and os.path.exists(config['devices_file']):
+                try:
+                    store.import_json(config['devices_file']) # before any local workers are spawned to share the store
+                except Exception as e:
+                    print(f"Error importing {config['devices_file']}, ignoring\n{e}")
+            for row in store.load_devices():
+                self.devices[row['hostname']] = row['ip_address']
+                self.hostnames[row['ip_address']] = row['hostname']
+        finally:
+            store.close()
+
+    def spawn_local_workers(self):
+        for i in range(self.cluster['local_workers']):
+            port = self.cluster['worker_port'] + 2 * i # control messages use port + 1
+            self.processes.append(subprocess.Popen(self.worker_command(port)))
+            print(f"🧵 Spawned local worker on port {port} (pid {self.processes[-1].pid})")
+
+    def worker_command(self, port):
+        cmd = [sys.executable, os.path.abspath(sys.argv[0]), '--role', 'worker', '--worker_port', str(port), '--frontend', '127.0.0.1']
+        # e.g. --mocks or --whisper, repr so fire parses the value back as the same type
+        cmd += [f"--{k}={v!r}" for k, v in self.overrides.items() if v is not None and k not in ('role', 'worker_port', 'frontend')]
+        return cmd
+
+    def live_workers(self):
+        now = time.time()
+        return sorted(w for w, t in self.workers.items() if now - t < self.cluster['worker_timeout'])
+
+    def rebalance(self):
+        with self.lock:
+            workers = self.live_workers()
+            for hostname in self.devices:
+                new = owner(hostname, workers)
+                old = self.assignments.get(hostname)
+                if new != old:
+                    print(f"🔀 {hostname} moved from worker {old} to {new}")
+                    self.assignments[hostname] = new
+                    if new:
+                        self.send_assignments(new)
+
+    def send_assignments(self, worker, greet=None):
+        ip, port = worker.split(":")
+        devices = {h: self.devices[h] for h, w in self.assignments.items() if w == worker}
+        msg = {'type': 'assignments', 'devices': devices, 'greet': greet}
+        self.control.sendto(json.dumps(msg).encode(), (ip, int(port) + 1))
+
+    def announce(self, hostname, ip):
+        with self.lock:
+            old_ip = self.devices.get(hostname)
+            if old_ip:
+                self.hostnames.pop(old_ip, None)
+            self.devices[hostname] = ip
+            self.hostnames[ip] = hostname
+            workers = self.live_workers()
+            worker = self.assignments.get(hostname)
+            if worker not in workers:
+                worker = owner(hostname, workers)
+            self.assignments[hostname] = worker
+            if worker is None:
+                print(f"[bold red]No live workers for {hostname}[/]")
+                return
+            print(f"📌 {hostname} assigned to worker {worker}")
+            self.send_assignments(worker, greet=hostname)
+
+    def control_listen(self):
+        while True:
+            try:
+                data, addr = self.control.recvfrom(65536)
+                msg = json.loads(data)
+                if msg['type'] == 'heartbeat':
+                    worker = f"{addr[0]}:{msg['port']}"
+                    with self.lock:
+                        joined = worker not in self.live_workers()
+                        self.workers[worker] = time.time()
+                    if joined:
+                        print(f"🟢 Worker {worker} joined")
+                        self.rebalance()
+                    with self.lock:
+                        self.send_assignments(worker) # lost control messages heal on the next heartbeat
+            except Exception:
+                print(traceback.format_exc())
+
+    def monitor(self):
+        live = set()
+        while True:
+            time.sleep(self.cluster['heartbeat_period'])
+            now_live = set(self.live_workers())
+            for worker in live - now_live:
+                print(f"🔴 Worker {worker} stopped responding, moving its devices")
+            if now_live != live:
+                self.rebalance()
+            live = now_live
+
+    def forward_audio(self):
+        chunk_bytes = self.config['mic']['chunk'] * 2
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind((self.config['udp']['ip'], self.config['udp']['port']))
+            while True:
+                data, addr = s.recvfrom(chunk_bytes)
+                hostname = self.hostnames.get(addr[0])
+                worker = self.assignments.get(hostname)
+                if worker:
+                    ip, port = worker.split(":")
+                    s.sendto(socket.inet_aton(addr[0]) + data, (ip, int(port)))
+
+    def close(self):
+        for p in self.processes:
+            p.terminate()
+
+def worker_control(manager, config):
+    """Heartbeat to the frontend and keep this worker's devices in line with its assignments."""
+    cluster = config['cluster']
+    port = config['udp']['port']
+    frontend = (cluster['frontend'], cluster['control_port'])
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("", port + 1))
+        s.settimeout(cluster['heartbeat_period'])
+        last_heartbeat = 0
+        while True:
+            try:
+                if time.time() - last_heartbeat >= cluster['heartbeat_period']:
+                    s.sendto(json.dumps({'type': 'heartbeat', 'port': port}).encode(), frontend)
+                    last_heartbeat = time.time()
+                try:
+                    data, _ = s.recvfrom(65536)
+                except socket.timeout:
+                    continue
+                msg = json.loads(data)
+                if msg['type'] == 'assignments':
+                    for hostname in list(manager.devices):
+                        if hostname not in msg['devices']:
+                            manager.release_device(hostname)
+                    for hostname, ip in msg['devices'].items():
+                        device = manager.devices.get(hostname)
+                        acquired = device is None or device.ip_address != ip
+                        if acquired or hostname == msg['greet']:
+                            device = manager.create_device(hostname, ip)
+                        if hostname == msg['greet']:
+                            device.send_audio(config['greeting_wav'], volume=14, fade=10, mic_timeout=30, cache=True)
+                        elif acquired:
+                            # e.g. moved here from a dead worker, the device keeps streaming to that host until contacted
+                            device.log.info("Claiming device from another worker")
+                            device.claim()
+            except Exception:
+                print(traceback.format_exc())
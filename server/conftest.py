@@ -0,0 +1,86 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+import yaml
+
+from devices import DeviceManager
+
+# shared by the tests in this directory, run with `python -m pytest` from server/
+
+def free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeDevice:
+    """Accepts TCP connections like the firmware and records the 6-byte header of each."""
+    def __init__(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.headers = []
+        self.audio = bytearray() # everything received after the headers
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            conn, _ = self.server.accept()
+            threading.Thread(target=self.read, args=(conn,), daemon=True).start()
+
+    def read(self, conn):
+        with conn:
+            header = b""
+            while len(header) < 6:
+                data = conn.recv(6 - len(header))
+                if not data:
+                    return
+                header += data
+            self.headers.append(header)
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                self.audio.extend(data)
+
+    def wait_for(self, command, timeout=3):
+        end = time.time() + timeout
+        while time.time() < end:
+            if any(h[0] == command for h in self.headers):
+                return True
+            time.sleep(0.01)
+        return False
+
+def voiced(seconds, f0=140, amplitude=8000, rate=16000):
+    """Synthetic voiced speech (harmonics of a wavering pitch, syllable-rate envelope) that webrtcvad classifies as speech."""
+    import numpy as np
+
+    t = np.arange(int(seconds * rate)) / rate
+    phase = 2 * np.pi * np.cumsum(f0 + 0.2 * f0 * np.sin(2 * np.pi * 2 * t)) / rate
+    signal = sum(np.sin(k * phase) / k for k in range(1, 15)) * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2)
+    return (signal / np.abs(signal).max() * amplitude).astype(np.int16)
+
+@pytest.fixture
+def fake_device():
+    return FakeDevice()
+
+@pytest.fixture
+def config(tmp_path, fake_device):
+    with open(os.path.join(os.path.dirname(__file__), 'config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['state_db'] = str(tmp_path / "devices.db")
+    config['devices_file'] = str(tmp_path / "devices.json")
+    config['audio_dir'] = str(tmp_path)
+    config['log_dir'] = str(tmp_path)
+    config['udp'] = {'ip': "127.0.0.1", 'port': free_port(socket.SOCK_DGRAM)}
+    config['tcp_port'] = fake_device.port
+    return config
+
+@pytest.fixture
+def manager(config):
+    manager = DeviceManager(config)
+    yield manager
+    manager.close()
@@ -2,22 +2,51 @@ import json
 import logging
 import os
 import socket
+import threading
 import time
+import numpy as np
 import webrtcvad
 
 from collections import deque
-from pydub import AudioSegment
-from logging import Formatter
-from rich.logging import RichHandler
-from rich.console import Console
 from rich import print
 
-class CustomFormatter(Formatter):
-    def format(self, record):
-        if record.levelno == logging.DEBUG:
-            return f"[dim][orange1][bold]{record.name}[/bold][/orange1] {record.msg}[/dim]"
-        else:
-            return f"[orange1][bold]{record.name}[/bold][/orange1]: {record.msg}"
+import audio
+from downlink import Downlink
+from logqueue import get_handler
+from profiler import timed
+from store import StateStore
+
+# rough token estimate (~4 chars per token for English), good enough for budgeting prompt size without a tokenizer
+CHARS_PER_TOKEN = 4
+
+def count_tokens(message):
+    content = message.get('content') or ''
+    function_call = message.get('function_call')
+    if function_call:
+        content += function_call.get('name', '') + function_call.get('arguments', '')
+    return 4 + len(content) // CHARS_PER_TOKEN # 4 for role & message framing
+
+def elide(message, max_tokens):
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(message.get('content') or '') <= max_chars:
+        return False
+    message['content'] = message['content'][:max_chars] + "\n...[truncated]"
+    return True
+
+def frame_energy(frames):
+    """RMS and zero-crossing rate of each row of a (n_frames, chunk) array of samples."""
+    frames = frames.astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return rms, zcr
+
+class WindowSnapshot:
+    # rendered only when the log record is formatted by the background listener
+    def __init__(self, window):
+        self.window = tuple(window)
+
+    def __str__(self):
+        return "["+"".join(["*" if x else "-" for x in self.window])+"]"
 
 class Vad:
     def __init__(self, config):
@@ -38,6 +67,14 @@ class Vad:
         self.new_segment = True
         self.led_power = 0
         self.fname = None
+        self.noise_floor = 0.0 # adaptive RMS of background noise, used to skip webrtcvad on clearly silent frames
+        self.skipped_frames = 0
+
+    def resize(self):
+        # apply changed window/pre-buffer lengths, keeping the most recent frames
+        FRAMES_PER_SECOND = int(self.config['mic']['rate'] / self.config['mic']['chunk'])
+        self.window = deque(self.window, maxlen=int(self.config['vad']['window_length'] * FRAMES_PER_SECOND))
+        self.pre_buffer = deque(self.pre_buffer, maxlen=int(self.config['vad']['pre_buffer_length'] * FRAMES_PER_SECOND))
 
     def reset(self):
         self.buffer = []
@@ -46,18 +83,117 @@ class Vad:
         self.frame_count = 0
         self.window.clear()
 
+    def is_speech(self, data, rms, zcr):
+        gate = self.config['vad']['pregate']
+        if gate['enabled']:
+            threshold = max(gate['min_rms'], self.noise_floor * gate['margin'])
+            # quiet, or hiss-like (high zero-crossing rate) without much energy above the threshold
+            if rms < threshold or (zcr > gate['max_zcr'] and rms < 2 * threshold):
+                self.skipped_frames += 1
+                self.update_noise_floor(rms)
+                return False
+
+        is_speech = self.vad.is_speech(data, self.config['mic']['rate'])
+        if gate['enabled'] and not is_speech:
+            self.update_noise_floor(rms)
+        return is_speech
+
+    def update_noise_floor(self, rms):
+        rate = self.config['vad']['pregate']['adapt_rate']
+        self.noise_floor += rate * (rms - self.noise_floor)
+
     def visualization(self):
-        return "["+"".join(["*" if x else "-" for x in self.window])+"]"
+        return WindowSnapshot(self.window)
+
+class EchoGate:
+    """
+    With barge-in the mic streams during playback, so it also hears the device's own speaker. What is being played is
+    known from the audio sent, so during playback (and a tail after it) a frame only counts as the user when it is clearly
+    louder than the echo expected from it: the playback level around that time scaled by the speaker-to-mic coupling,
+    which is learned at the start of each playback.
+    """
+    MIN_LEVEL = 50 # playback RMS below this (e.g. silence between fillers and responses) can't produce echo to learn from
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock() # levels are added from the downlink loop and read from the UDP thread
+        self.levels = deque() # (monotonic time the audio is expected to play, RMS) of each mic frame of audio sent
+        self.until = 0.0 # when the device should have finished playing, plus the echo tail
+        self.coupling = None # mic RMS per unit of playback RMS, kept across playbacks as it depends on the hardware
+        self.warmup_until = 0.0
+        self.pending = bytearray() # played audio not yet making up a whole mic frame, the downlink may send a few bytes at a time
+        self.pending_at = 0.0
+
+    def played(self, at, pcm):
+        cfg = self.config['barge_in']
+        rate, frame_bytes = self.config['mic']['rate'], self.config['mic']['chunk'] * 2
+        with self.lock:
+            if at > self.until: # new playback, learn the coupling again at first in case the volume changed
+                self.warmup_until = at + cfg['echo_warmup']
+                self.pending.clear()
+            if not self.pending:
+                self.pending_at = at
+            self.pending += pcm
+            # levels over mic frame sized blocks, comparable with the RMS of the frames the mic sends back
+            while len(self.pending) >= frame_bytes:
+                samples = np.frombuffer(self.pending[:frame_bytes], dtype=np.int16).astype(np.float32)
+                self.levels.append((self.pending_at, float(np.sqrt(np.mean(samples * samples)))))
+                del self.pending[:frame_bytes]
+                self.pending_at += frame_bytes / 2 / rate
+            self.until = max(self.until, at + len(pcm) / 2 / rate + cfg['echo_tail'])
+
+    def stop(self):
+        # device was told to stop playing, only what it already played can still echo
+        with self.lock:
+            self.levels.clear()
+            self.pending.clear()
+            self.until = min(self.until, time.monotonic() + self.config['barge_in']['echo_tail'])
+
+    def active(self, now=None):
+        return (now or time.monotonic()) < self.until
+
+    def expected_level(self, now):
+        window = self.config['barge_in']['echo_window']
+        with self.lock:
+            while len(self.levels) > 1 and self.levels[0][0] < now - window: # the last level stands for the tail
+                self.levels.popleft()
+            return max((rms for at, rms in self.levels if at <= now + window), default=0.0)
+
+    def is_echo(self, rms, now=None):
+        now = now or time.monotonic()
+        if not self.active(now):
+            return False
+        cfg = self.config['barge_in']
+        level = self.expected_level(now)
+        if level < self.MIN_LEVEL:
+            return False # nothing loud enough being played to echo
+        if self.coupling is None or now < self.warmup_until:
+            self.learn(rms / level)
+            return True # ignored until the coupling is known
+        # not learned from later on, as the user talking over the response would raise it until they're ignored too
+        return rms < cfg['echo_margin'] * self.coupling * level
+
+    def learn(self, coupling):
+        rate = self.config['barge_in']['echo_adapt_rate']
+        self.coupling = coupling if self.coupling is None else self.coupling + rate * (coupling - self.coupling)
 
 class Device:
-    def __init__(self, hostname, ip_address, config, messages=None, voice=None):
+    def __init__(self, hostname, ip_address, config, messages=None, voice=None, summary=None, store=None, downlink=None):
         self.config = config
         self.hostname = hostname
         self.ip_address = ip_address
-        self.messages = self.init_messages(messages)
+        self.store = store
+        self.downlink = downlink
+        self.summary = summary # compact memory of pruned messages, appended to the system prompt
+        self.summary_lock = threading.Lock()
+        # with a store, history is loaded lazily on first access to keep startup fast
+        self._messages = None if (store and messages is None) else self.init_messages(messages)
         self.last_beeper_results = {}
         self.last_response = None
+        self.job = None # current ResponseJob, cancelled on barge-in
+        self.partial = None # last partial transcription of the utterance being recorded, reused for the final one
         self.vad = Vad(self.config)
+        self.echo = EchoGate(self.config)
         self.log = self.setup_logger()
         self.voice = self.config["elevenlabs_default_voice"] if voice is None else voice
 
@@ -72,6 +208,8 @@ class Device:
             init_prompt += self.config['llm']['maubot_prompt_append']
         init_prompt += self.config['llm']['reminder_prompt_append']
         init_prompt = init_prompt.replace("{USER}", self.config['llm']['users_name'])
+        if(self.summary):
+            init_prompt += f"\nSummary of your earlier conversation with {self.config['llm']['users_name']}: {self.summary}"
         return init_prompt
 
     def init_messages(self, messages):
@@ -82,8 +220,20 @@ class Device:
             messages[0] = first_message #update first message in case of change of config
             return messages
         
+    @property
+    def messages(self):
+        if self._messages is None:
+            self._messages = self.init_messages([None] + self.store.load_messages(self.hostname))
+        return self._messages
+
     def add_message(self, message):
         self.messages.append(message)
+        if self.store:
+            self.store.append_message(self.hostname, message)
+
+    def save(self):
+        if self.store:
+            self.store.save_device(self)
 
     def get_messages(self):
         return self.messages
@@ -92,38 +242,89 @@ class Device:
         logger = logging.getLogger(self.hostname)
         logger.setLevel(logging.DEBUG)
 
-        # log to console with rich
-        console_handler = RichHandler(console=Console(), rich_tracebacks=True, markup=True, highlighter=None)
-        console_handler.setFormatter(CustomFormatter())
-        logger.addHandler(console_handler)
-
-        # log to file
-        file_handler = logging.FileHandler(os.path.join(self.config['log_dir'], f"{self.hostname}.log"))
-        file_format = '%(asctime)s - %(levelname)s - %(message)s'
-        file_handler.setFormatter(logging.Formatter(file_format))
-        logger.addHandler(file_handler)
+        # console (rich) & file output happen on a background listener, see logqueue.py
+        handler = get_handler(self.config)
+        if handler not in logger.handlers: # device may be re-created, e.g. when moved between cluster workers
+            logger.addHandler(handler)
+        logger.propagate = False
         return logger
 
-    def send_audio(self, fname, mic_timeout=5 * 60, volume=13, fade=10):
+    def load_audio(self, fname, cache=False):
+        return audio.load_pcm(os.path.join(self.config['audio_dir'], fname), self.config['mic']['rate'], cache=cache)
+
+    def send_audio(self, fname, mic_timeout=5 * 60, volume=13, fade=10, cache=False, finish=True, listen=False):
         # header[0]   0xAA for audio
         # header[1:2] mic timeout in seconds (after audio is done playing)
         # header[3]   volume
         # header[4]   fade rate of LED's VAD visualization
-        # header[5]   not used
-        header = bytes([0xaa, (mic_timeout & 0xff00) >> 8, mic_timeout & 0xff, volume, fade, 0])
-        audio_data = (
-            AudioSegment.from_file(os.path.join(self.config['audio_dir'], fname))
-            .set_channels(1)
-            .set_frame_rate(16000)
-            .set_sample_width(2)
-            .raw_data
-        )
-        self.send_TCP(header, audio_data, tcp_timeout=60) # 60 (!!) second tcp_timeout for audio as we currently read bytes from TCP as I2S buffer frees up
+        # header[5]   flags, bit 0 keeps the mic streaming during playback so the user can interrupt (barge-in)
+        header = bytes([0xaa, (mic_timeout & 0xff00) >> 8, mic_timeout & 0xff, volume, fade, 0x01 if listen else 0])
+        # paced at playback rate, returns a Playback that can be waited on (`done`), cancelled, or (if not finished) fed more audio
+        return self.downlink.play(self, header, self.load_audio(fname, cache), finish=finish)
+
+    def is_playing(self):
+        # including the tail of audio the device has buffered after the server sent the last of it
+        return self.echo.active() or (self.downlink is not None and self.hostname in self.downlink.active)
+
+    def history_tokens(self):
+        return sum(count_tokens(m) for m in self.messages[1:])
+
+    def prune_messages(self, summarize=None):
+        """
+        Keep conversation history within `max_messages` and the `max_history_tokens` budget.
+        Bulky function results are truncated first (the most recent one only if still over budget), then the oldest
+        messages are dropped. Dropped messages are passed to `summarize(device, dropped)` if given.
+        """
+        llm_config = self.config['llm']
+        max_tokens = llm_config['max_history_tokens']
+        changed = False
+        function_indices = [i for i, m in enumerate(self.messages) if m['role'] == 'function']
+        for i in function_indices[:-1]:
+            if elide(self.messages[i], llm_config['max_function_tokens']):
+                self.log.debug(f"Truncated function result: {self.messages[i]['name']}")
+                changed = True
+
+        tokens = self.history_tokens()
+        if tokens > max_tokens and function_indices:
+            last = self.messages[function_indices[-1]]
+            if elide(last, llm_config['max_function_tokens']):
+                self.log.debug(f"Truncated latest function result: {last['name']}")
+                tokens = self.history_tokens()
+                changed = True
+
+        dropped = []
+        while len(self.messages) > 1 and (len(self.messages) > llm_config['max_messages'] or tokens > max_tokens):
+            message = self.messages.pop(1)
+            tokens -= count_tokens(message)
+            dropped.append(message)
+            # don't leave a function result without the function call that requested it
+            while len(self.messages) > 1 and self.messages[1]['role'] == 'function':
+                message = self.messages.pop(1)
+                tokens -= count_tokens(message)
+                dropped.append(message)
+
+        if (changed or dropped) and self.store:
+            self.store.replace_messages(self.hostname, self.messages[1:])
+        if dropped:
+            self.log.debug(f"Pruned {len(dropped)} messages, history is now {tokens} tokens")
+            if summarize:
+                summarize(self, dropped)
+        return dropped
+
+    def truncate_messages(self, count):
+        if len(self.messages) > count:
+            del self.messages[count:]
+            if self.store:
+                self.store.replace_messages(self.hostname, self.messages[1:])
 
-    def prune_messages(self):
-        while(len(self.messages) > self.config['llm']['max_messages']):
-            self.log.debug(f"Pruning message: {self.messages[1]['role']}")
-            self.messages.pop(1)
+    def set_summary(self, summary):
+        self.summary = summary
+        self.refresh_system_prompt()
+        self.save()
+
+    def refresh_system_prompt(self):
+        if self._messages is not None: # otherwise built from config when loaded
+            self._messages[0] = {"role": "system", "content": self.construct_init_prompt()}
 
     def update_LEDs(self, is_speech):
         if(is_speech): # accumulate power until ready to update LED's
@@ -140,21 +341,42 @@ class Device:
                 self.send_TCP(header, None, 0.1)
             self.vad.led_power = 0
 
-    def stop_listening(self):
+    def stop_listening(self, mic_timeout=0):
         # header[0]   0xDD for mic timeout command
         # header[1:2] mic timeout in seconds
         # header[3:5] not used
-        header = bytes([0xdd, 0, 0, 0, 0, 0])
+        header = bytes([0xdd, (mic_timeout & 0xff00) >> 8, mic_timeout & 0xff, 0, 0, 0])
         self.send_TCP(header, None, 0.2)
 
+    def claim(self):
+        # header[0]   0xCC for LED blink command, at zero intensity so the only effect is the device now streaming its
+        #             audio to this server (it sends to whichever server last connected to it)
+        # header[1]   starting intensity for rampdown
+        # header[2:4] RGB color
+        # header[5]   fade rate
+        header = bytes([0xcc, 0, 0, 0, 0, self.config['led']['fade']])
+        self.downlink.command(self, header)
+
+    def stop_playback_header(self, mic_timeout=10):
+        # header[0]   0xEE for stop playback command - flushes audio being played, honored mid-playback
+        # header[1:2] mic timeout in seconds (to hear the interruption out)
+        # header[3:5] not used
+        return bytes([0xee, (mic_timeout & 0xff00) >> 8, mic_timeout & 0xff, 0, 0, 0])
+
+    def cancel_response(self, reason):
+        if self.job and self.job.is_active() and not self.job.cancelled.is_set():
+            self.log.info(f"✋ Cancelling response ({reason})")
+            self.job.cancel()
+
     def send_TCP(self, header, data, tcp_timeout):
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(tcp_timeout)
         try:
-            s.connect((self.ip_address, self.config['tcp_port']))
-            s.sendall(header)
-            if(data):
-                s.sendall(data)
+            with timed("send_TCP"):
+                s.connect((self.ip_address, self.config['tcp_port']))
+                s.sendall(header)
+                if(data):
+                    s.sendall(data)
         except socket.timeout:
             self.log.error(f"TCP timeout sending {'header' if data is None else 'data'} ({tcp_timeout} seconds)")
         except Exception as e:
@@ -169,64 +391,104 @@ class Device:
             'ip_address': self.ip_address,
             'messages': self.messages,
             'voice': self.voice,
+            'summary': self.summary,
         }
 
     @classmethod
-    def from_dict(cls, data, config):
-        return cls(data['hostname'], data['ip_address'], config, data.get('messages', data['voice']))
+    def from_dict(cls, data, config, store=None, downlink=None):
+        return cls(
+            data['hostname'],
+            data['ip_address'],
+            config,
+            messages=data.get('messages'),
+            voice=data.get('voice'),
+            summary=data.get('summary'),
+            store=store,
+            downlink=downlink,
+        )
 
     def __repr__(self):
+        if self._messages is None:
+            return f"{self.hostname} {self.ip_address} [not loaded]"
         return f"{self.hostname} {self.ip_address} [{len(self.messages) - 1} messages]"
 
 class DeviceManager:
     def __init__(self, config):
         self.devices = {}
         self.config = config
-        self.load_from_json()
+        self.store = StateStore(config)
+        self.downlink = Downlink(config)
+        self.load_from_store()
+        threading.Thread(target=self.compact_periodically, daemon=True).start()
 
     def create_device(self, hostname, ip_address):
         device = self.devices.get(hostname)
         if device is None:
-            device = Device(hostname, ip_address, self.config)
+            row = self.store.load_device(hostname) # e.g. moved here from another worker
+            if row:
+                device = Device.from_dict(row, self.config, store=self.store, downlink=self.downlink)
+                self.devices[hostname] = device
+        if device is None:
+            device = Device(hostname, ip_address, self.config, store=self.store, downlink=self.downlink)
             self.devices[hostname] = device
+            device.save()
             device.log.info(f'Created new device with IP {ip_address}')
         elif device.ip_address != ip_address:
             device.ip_address = ip_address
+            device.save()
             device.log.info(f'Updated IP address to {ip_address}')
         else:
             device.log.info(f'Device already exists with IP {ip_address}')
         return device
 
+    def release_device(self, hostname):
+        # device is now handled elsewhere, its state will be reloaded from the store if it comes back
+        device = self.devices.pop(hostname, None)
+        if device:
+            device.log.info("Released to another worker")
+
     def get_device_from_ip(self, ip_address):
         for device in self.devices.values():
             if device.ip_address == ip_address:
                 return device
         return None
-    
-    def save_to_json(self):
-        print(f"Saving devices to {self.config['devices_file']}")
-        with open(self.config['devices_file'], 'w') as f:
+
+    def save_to_json(self, fname=None):
+        # export only (admin API), state is persisted to the store as it changes. Imported by `StateStore.import_json`
+        fname = fname or self.config['devices_file']
+        print(f"Saving devices to {fname}")
+        with open(fname, 'w') as f:
             json_devices = {k: v.to_dict() for k, v in self.devices.items()}
             json.dump(json_devices, f, indent=4)
+        return {'file': fname, 'devices': len(json_devices)}
 
-    def load_from_json(self):
-        if os.path.exists(self.config['devices_file']):
-            with open(self.config['devices_file'], 'r') as f:
-                try:
-                    json_devices = json.load(f)
-                    if(len(json_devices) > 0):
-                        self.devices = {k: Device.from_dict(v, self.config) for k, v in json_devices.items()}
-                        print(f"\n🍐 Loaded {len(self.devices)} devices from [bold]{self.config['devices_file']}[/]:")
-                        for device in self.devices.values():
-                            print(f"{device.hostname} \t [dim]{device.ip_address}[/] \tMessages: {len(device.messages)}")
-                    else:
-                        print(f"File {self.config['devices_file']} is empty, using empty device manager")
-                except Exception as e:
-                    print(f"Error loading {self.config['devices_file']}, using empty device manager\n{e}")
+    def load_from_store(self):
+        if self.store.is_empty() and os.path.exists(self.config['devices_file']):
+            try:
+                self.store.import_json(self.config['devices_file'])
+            except Exception as e:
+                print(f"Error importing {self.config['devices_file']}, ignoring\n{e}")
+
+        rows = self.store.load_devices()
+        if(len(rows) > 0):
+            self.devices = {r['hostname']: Device.from_dict(r, self.config, store=self.store, downlink=self.downlink) for r in rows}
+            print(f"\n🍐 Loaded {len(self.devices)} devices from [bold]{self.config['state_db']}[/]:")
+            for r in rows:
+                print(f"{r['hostname']} \t [dim]{r['ip_address']}[/] \tMessages: {r['message_count']}")
         else:
-            print(f"File {self.config['devices_file']} does not exist, using empty device manager")
+            print(f"No devices in {self.config['state_db']}, using empty device manager")
 
-    def __repr__(self):
-        return '\n'.join(str(device) for device in self.devices)
+    def compact_periodically(self):
+        while True:
+            time.sleep(self.config['state_compact_period'])
+            try:
+                self.store.compact()
+            except Exception as e:
+                print(f"Error compacting {self.config['state_db']}: {e}")
 
+    def close(self):
+        print(f"Closing {self.config['state_db']}")
+        self.store.close()
 
+    def __repr__(self):
+        return '\n'.join(str(device) for device in self.devices.values())
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+class Playback:
+    """
+    One stream of audio to a device. Audio can be fed in pieces (`feed`) until `finish` is called, and the
+    stream can be cancelled at any point. All state is only touched on the downlink's event loop.
+    """
+    def __init__(self, downlink, device, header):
+        self.downlink = downlink
+        self.device = device
+        self.header = header
+        self.buffer = bytearray()
+        self.finished = False
+        self.cancelled = False
+        self.stop_header = None # sent to the device on a new connection when cancelled, before closing the stream
+        self.underruns = 0
+        self.sent_bytes = 0
+        self.data_ready = None # created on the event loop
+        self.done = threading.Event()
+
+    def feed(self, pcm):
+        self.downlink.loop.call_soon_threadsafe(self._feed, pcm)
+        return self
+
+    def finish(self):
+        self.downlink.loop.call_soon_threadsafe(self._finish)
+        return self
+
+    def cancel(self, stop_header=None):
+        self.downlink.loop.call_soon_threadsafe(self._cancel, stop_header)
+        return self
+
+    def _feed(self, pcm):
+        self.buffer.extend(pcm)
+        self._wake()
+
+    def _finish(self):
+        self.finished = True
+        self._wake()
+
+    def _cancel(self, stop_header):
+        self.cancelled = True
+        self.stop_header = stop_header
+        self._wake()
+
+    def _wake(self):
+        if self.data_ready:
+            self.data_ready.set()
+
+class Downlink:
+    """
+    Sends audio to all devices from one asyncio event loop, paced at the device's playback rate plus a lead buffer,
+    instead of one blocking `sendall` per playback that the ESP32 only drains as its I2S buffer frees up.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.bytes_per_second = config['mic']['rate'] * 2 # devices play 16-bit mono at the mic rate
+        self.loop = asyncio.new_event_loop()
+        self.active = {} # hostname -> latest Playback, so playbacks to one device are sent one after another
+        threading.Thread(target=self.loop.run_forever, daemon=True, name="downlink").start()
+
+    def play(self, device, header, pcm=None, finish=True):
+        playback = Playback(self, device, header)
+        if pcm is not None:
+            playback.buffer.extend(pcm)
+        playback.finished = finish
+        asyncio.run_coroutine_threadsafe(self.start(playback), self.loop)
+        return playback
+
+    def command(self, device, header):
+        # control headers from threads that shouldn't block on a TCP connect
+        asyncio.run_coroutine_threadsafe(self.send_command(device, header), self.loop)
+
+    async def start(self, playback):
+        previous = self.active.get(playback.device.hostname)
+        self.active[playback.device.hostname] = playback
+        playback.data_ready = asyncio.Event()
+        if previous and not previous.done.is_set():
+            await self.loop.run_in_executor(None, previous.done.wait) # firmware serves one TCP client at a time
+        try:
+            await self.send(playback)
+        except asyncio.TimeoutError:
+            playback.device.log.error(f"TCP timeout sending audio")
+        except Exception as e:
+            playback.device.log.error(f"TCP error: {e}")
+        finally:
+            if self.active.get(playback.device.hostname) is playback:
+                del self.active[playback.device.hostname]
+            playback.done.set()
+
+    async def send(self, playback):
+        cfg = self.config['downlink']
+        device = playback.device
+        lead_bytes = int(cfg['lead_seconds'] * self.bytes_per_second)
+        chunk_bytes = int(cfg['chunk_ms'] / 1000 * self.bytes_per_second) & ~1 # whole samples only
+
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(device.ip_address, self.config['tcp_port']), cfg['connect_timeout']
+        )
+        try:
+            writer.write(playback.header)
+            start = None # when the first audio was sent, playback position is estimated from this
+            offset = 0
+            while not playback.cancelled:
+                if offset >= len(playback.buffer):
+                    if playback.finished:
+                        break
+                    if start is not None:
+                        # held open for more audio (e.g. the response after a filler), feed silence meanwhile as the ESP32's
+                        # I2S DMA would keep replaying its last buffers. Only just ahead of playback, to not delay what follows
+                        played = (time.monotonic() - start) * self.bytes_per_second
+                        if playback.sent_bytes - played < 2 * chunk_bytes:
+                            playback.buffer.extend(bytes(chunk_bytes))
+                            continue
+                        playback.data_ready.clear()
+                        try:
+                            await asyncio.wait_for(playback.data_ready.wait(), cfg['chunk_ms'] / 1000)
+                        except asyncio.TimeoutError:
+                            pass
+                        continue
+                    playback.data_ready.clear()
+                    await playback.data_ready.wait()
+                    continue
+
+                now = time.monotonic()
+                if start is None:
+                    start = now
+                played = (now - start) * self.bytes_per_second
+                if played > playback.sent_bytes and playback.sent_bytes > 0:
+                    # device has run out of audio, restart the clock from here
+                    playback.underruns += 1
+                    device.log.warning(f"Playback underrun ({(played - playback.sent_bytes) / self.bytes_per_second:.2f}s behind)")
+                    start = now - playback.sent_bytes / self.bytes_per_second
+                    played = playback.sent_bytes
+
+                allowed = int(played + lead_bytes - playback.sent_bytes) & ~1
+                if allowed <= 0:
+                    await asyncio.sleep(cfg['chunk_ms'] / 1000)
+                    continue
+
+                n = min(allowed, chunk_bytes, len(playback.buffer) - offset)
+                chunk = playback.buffer[offset:offset + n]
+                writer.write(chunk)
+                device.echo.played(start + playback.sent_bytes / self.bytes_per_second, chunk) # for echo gating during barge-in
+                await asyncio.wait_for(writer.drain(), cfg['write_timeout'])
+                offset += n
+                playback.sent_bytes += n
+                if offset > 1 << 20: # drop what has been sent for long responses
+                    del playback.buffer[:offset]
+                    offset = 0
+            if playback.cancelled and playback.stop_header:
+                # the firmware only checks for a stop command while the stream is open
+                await self.send_command(device, playback.stop_header)
+                device.echo.stop()
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass # e.g. reset by the device after a stop command, the stream is closed either way
+
+        seconds = playback.sent_bytes / self.bytes_per_second
+        if playback.cancelled:
+            device.log.info(f"Playback cancelled after {seconds:.1f}s")
+        else:
+            device.log.debug(f"Sent {seconds:.1f}s of audio ({playback.underruns} underruns)")
+
+    async def send_command(self, device, header):
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(device.ip_address, self.config['tcp_port']), self.config['downlink']['connect_timeout']
+            )
+            writer.write(header)
+            await asyncio.wait_for(writer.drain(), self.config['downlink']['write_timeout'])
+            writer.close()
+            await writer.wait_closed()
+        except asyncio.TimeoutError:
+            device.log.error(f"TCP timeout sending header {header[0]:#x}")
+        except Exception as e:
+            device.log.error(f"TCP error sending header {header[0]:#x}: {e}")
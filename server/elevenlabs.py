@@ -1,10 +1,13 @@
 import json
+import numpy as np
 import os
 import requests
 from datetime import datetime
-from pydub import AudioSegment
+
 from rich import print
 
+import audio
+
 class ElevenLabs:
     def __init__(self, config):
         with open("credentials.json", "r") as f:
@@ -14,14 +17,20 @@ class ElevenLabs:
             'Content-Type': 'application/json',
             'xi-api-key': token
         }
-        self.default_voice = config["elevenlabs_default_voice"]
-        self.URL = "https://api.elevenlabs.io/v1/"
+        self.config = config
+        self.URL = config['elevenlabs_url']
         self.jsonfile = config['voices_file']
         self.voices = self.get_voices()
         self.temp_wav_fname = config['temp_wav_fname']
+        self.output_format = config['elevenlabs_output_format']
+        self.rate = config['mic']['rate']
         for k,v in self.voices.items():
             print(f"{v['name']} \t[dim]({v['voice_id']})[/dim]")
 
+    @property
+    def default_voice(self):
+        return self.config["elevenlabs_default_voice"] # can be changed while running (admin API)
+
     def get_voices(self):
         if(os.path.exists(self.jsonfile)):
             with open(self.jsonfile, "r") as f:
@@ -51,7 +60,7 @@ class ElevenLabs:
             device.log.warning(f"Voice '{device.voice}' not found, using default {self.default_voice}")
             return self.voices[self.default_voice]['voice_id']
 
-    def text_to_speech(self, device, text, path_name="data"):
+    def text_to_speech(self, device, text, path_name="data", job=None):
         now = datetime.now()
         now_str = now.strftime("%Y-%m-%d_%H-%M-%S")
 
@@ -59,17 +68,36 @@ class ElevenLabs:
             "text": text
         })
         voice_id = self.get_voice_id(device)
-        response = requests.request("POST", f"{self.URL}text-to-speech/{voice_id}", headers=self.headers, data=payload)
+        response = requests.request(
+            "POST", f"{self.URL}text-to-speech/{voice_id}", headers=self.headers, data=payload, stream=True,
+            params={"output_format": self.output_format},
+        )
         if response.status_code != 200:
             device.log.error(f"Error: {response.status_code}\n{response.text}")
             return None
-        fname = os.path.join(path_name, f'{voice_id}_{now_str}.mp3')
-        device.log.debug(f"Saving audio response to {fname}", extra={"highlighter": None})
-        with open(fname, 'wb') as f:
-            f.write(response.content)
-        
-        audio = AudioSegment.from_mp3(fname)
-        audio.export(os.path.join(path_name, self.temp_wav_fname), format="wav")
+        data = bytearray()
+        with response:
+            for chunk in response.iter_content(chunk_size=16384):
+                if job:
+                    job.check() # stop downloading audio nobody will hear
+                data.extend(chunk)
+
+        # raw PCM at the device rate just needs a WAV header, other rates are resampled, only mp3 needs ffmpeg
+        if self.output_format.startswith("pcm_"):
+            rate_in = int(self.output_format.split("_")[1])
+            if rate_in == self.rate:
+                pcm = bytes(data)
+            else:
+                samples = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768
+                pcm = audio.to_int16(audio.resample(samples, rate_in, self.rate)).tobytes()
+        else:
+            fname = os.path.join(path_name, f'{voice_id}_{now_str}.mp3')
+            device.log.debug(f"Saving audio response to {fname}", extra={"highlighter": None})
+            with open(fname, 'wb') as f:
+                f.write(data)
+            pcm = audio.decode_ffmpeg(fname, self.rate)
 
-        return self.temp_wav_fname
+        wav_fname = f"{device.hostname}_{self.temp_wav_fname}" # per device as responses for several devices can be in flight
+        audio.write_wav(os.path.join(path_name, wav_fname), pcm, self.rate)
+        return wav_fname
 
@@ -0,0 +1,32 @@
+import threading
+
+class Cancelled(Exception):
+    pass
+
+class ResponseJob:
+    """
+    The LLM > TTS > playback work for one utterance. Cancelled when the user speaks again (barge-in) so the server
+    stops spending LLM/TTS calls and playback on a stale response.
+    """
+    def __init__(self, device, text, previous=None):
+        self.device = device
+        self.text = text
+        self.previous = previous # the device's previous job, waited on so only one job changes its history at a time
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.playback = None
+        self.lock = threading.Lock() # guards starting playback, either the filler or the response
+        self.message_count = None # history length before this job, restored if cancelled
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.playback and not self.playback.done.is_set():
+            # the stop command is sent from the downlink's event loop, this is called from the UDP thread
+            self.playback.cancel(stop_header=self.device.stop_playback_header())
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+    def is_active(self):
+        return not self.done.is_set() or (self.playback is not None and not self.playback.done.is_set())
@@ -2,6 +2,7 @@ import dateparser
 import json
 import os
 import requests
+import threading
 import time
 from datetime import datetime, timedelta
 from dateutil import tz
@@ -10,17 +11,28 @@ import openai
 from rich import print
 
 import devices
+from jobs import Cancelled
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 class OpenAIFunctionCalling:
     def __init__(self, config):
         self.config = config
+        if config['openai_api_base']: # e.g. local mock services for benchmarking
+            openai.api_base = config['openai_api_base']
+            openai.api_key = openai.api_key or "mock"
         self.functions = self.setup_functions()
 
-    def call_gpt_retry(self, device, max_retries=4, include_functions=False):
+    def home_assistant(self):
+        with open("credentials.json", "r") as f:
+            cred = json.load(f)
+        return self.config['home_assistant_url'] or cred.get("home_assistant_url"), cred.get("home_assistant_token")
+
+    def call_gpt_retry(self, device, max_retries=4, include_functions=False, job=None):
         wait_time = 0.5
         for attempt in range(max_retries):
+            if job:
+                job.check() # requests in flight can't be aborted, but don't start new ones
             try:
                 if(include_functions):
                     response = openai.ChatCompletion.create(
@@ -36,6 +48,8 @@ class OpenAIFunctionCalling:
                         max_tokens=150,
                     )
                 return (True, response)
+            except Cancelled:
+                raise
             except Exception as e:
                 device.log.error(f"Attempt {attempt+1} of {max_retries} failed: {e}")
                 if attempt < max_retries - 1:
@@ -44,16 +58,18 @@ class OpenAIFunctionCalling:
                 else:
                     return (False, e)
 
-    def askGPT(self, device, question):
-        device.messages.append({"role": "user", "content": question})
+    def askGPT(self, device, question, job=None):
+        device.add_message({"role": "user", "content": question})
 
-        success, response = self.call_gpt_retry(device, include_functions=bool(self.functions))
+        success, response = self.call_gpt_retry(device, include_functions=bool(self.functions), job=job)
         if not success:
             return f"Error: {response}"
+        if job:
+            job.check() # cancelled while waiting on the response, don't add it to history
 
         first_message = response["choices"][0]["message"]
         device.log.info(f"OpenAI Response: \n{first_message}")
-        device.messages.append(first_message.to_dict())
+        device.add_message(first_message.to_dict())
         if first_message.get("function_call"):
             available_functions = {}
             if(self.config['use_notes']):
@@ -65,12 +81,14 @@ class OpenAIFunctionCalling:
             if(self.config['use_home_assistant']):
                 available_functions["control_light"] = self.control_light
 
+            if job:
+                job.check() # before any side effects such as sending a message
             function_name = first_message["function_call"]["name"]
             function_to_call = available_functions[function_name]
             function_args = json.loads(first_message["function_call"]["arguments"])
             function_response = function_to_call(device, **function_args)
 
-            device.messages.append(
+            device.add_message(
                 {
                     "role": "function",
                     "name": function_name,
@@ -78,16 +96,45 @@ class OpenAIFunctionCalling:
                 }
             )
 
-            success, response = self.call_gpt_retry(device, include_functions=False) # don't include functions to get a response
+            success, response = self.call_gpt_retry(device, include_functions=False, job=job) # don't include functions to get a response
             if not success:
                 return f"Error: {' '.join(response.split(' ')[:4])}"
-            
+            if job:
+                job.check()
+
             device.log.info(f"OpenAI second response content: \n{response['choices'][0]['message']['content']}")
-            device.messages.append(response["choices"][0]["message"].to_dict())
+            device.add_message(response["choices"][0]["message"].to_dict())
             return response['choices'][0]['message']['content']
         else:
             return first_message["content"]
 
+    def summarize_async(self, device, dropped):
+        # summarizing is slow so do it off the response path, the memory just lands in the system prompt for a later turn
+        threading.Thread(target=self.summarize, args=(device, dropped), daemon=True).start()
+
+    def summarize(self, device, dropped):
+        with device.summary_lock: # serialize so consecutive prunes build on each other's summary
+            transcript = "\n".join(
+                f"{m['role']}: {(m.get('content') or m.get('function_call', {}).get('name', ''))[:500]}" for m in dropped
+            )
+            if device.summary:
+                transcript = f"Previous summary: {device.summary}\n{transcript}"
+            try:
+                response = openai.ChatCompletion.create(
+                    model=self.config['llm']['summary_model'],
+                    messages=[
+                        {"role": "system", "content": self.config['llm']['summary_prompt']},
+                        {"role": "user", "content": transcript},
+                    ],
+                    max_tokens=self.config['llm']['summary_max_tokens'],
+                )
+            except Exception as e:
+                device.log.error(f"Summarizing pruned messages failed: {e}")
+                return
+            summary = response['choices'][0]['message']['content'].strip()
+            device.log.debug(f"Updated conversation summary: {summary}")
+            device.set_summary(summary)
+
     def setup_functions(self):
         self.functions = []
         USERS_NAME = self.config['llm']['users_name']
@@ -183,10 +230,7 @@ class OpenAIFunctionCalling:
 
         # this requires a Home Assistant server running - see https://www.home-assistant.io/installation/linux#docker-compose
         if(self.config['use_home_assistant']):
-            with open('credentials.json') as json_file:
-                cred = json.load(json_file)
-            HA_URL = cred['home_assistant_url']
-            HA_TOKEN = cred['home_assistant_token']
+            HA_URL, HA_TOKEN = self.home_assistant()
 
             print(f"\n🏡 Fetching lights from Home Assistant at {HA_URL} to add to function definition for OpenAI")
             
@@ -325,10 +369,7 @@ class OpenAIFunctionCalling:
             return "Sent dummy message"
         
     def control_light(self, device, entity_id, rgb_color=None, brightness=None):
-        with open("credentials.json", "r") as f:
-            cred = json.load(f)
-        HA_TOKEN = cred.get("home_assistant_token")
-        HA_URL = cred.get("home_assistant_url")
+        HA_URL, HA_TOKEN = self.home_assistant()
 
         params={"entity_id": entity_id}
         if(rgb_color):
@@ -0,0 +1,136 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+from rich.console import Console
+from rich.logging import RichHandler
+from rich.text import Text
+
+# Device loggers only put records on a queue, a background listener does the rich formatting and file I/O,
+# so the UDP & transcribe threads never block on console rendering or disk.
+
+class CustomFormatter(Formatter):
+    def format(self, record):
+        if record.levelno == logging.DEBUG:
+            message = f"[dim][orange1][bold]{record.name}[/bold][/orange1] {record.getMessage()}[/dim]"
+        else:
+            message = f"[orange1][bold]{record.name}[/bold][/orange1]: {record.getMessage()}"
+        if record.exc_text:
+            message += f"\n{record.exc_text}"
+        return message
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # don't format on the calling thread, message args are only rendered by the listener
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class RateLimitFilter(logging.Filter):
+    """Drop DEBUG records beyond `rate` per second from each line of code, per device."""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.windows = {} # (logger, file, line) -> [window start, count, suppressed]
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.rate:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        window = self.windows.get(key)
+        if window is None or now - window[0] >= 1.0:
+            suppressed = window[2] if window else 0
+            self.windows[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed # reported with the next record that gets through
+            return True
+        window[1] += 1
+        if window[1] > self.rate:
+            window[2] += 1
+            return False
+        return True
+
+class DeviceFileHandler(logging.Handler):
+    """Per-device log files, as JSON lines for later analysis or plain text."""
+    def __init__(self, log_dir, json_lines=True):
+        super().__init__()
+        self.log_dir = log_dir
+        self.json_lines = json_lines
+        self.files = {}
+        self.plain = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    def emit(self, record):
+        try:
+            f = self.files.get(record.name)
+            if f is None:
+                ext = "jsonl" if self.json_lines else "log"
+                f = self.files[record.name] = open(os.path.join(self.log_dir, f"{record.name}.{ext}"), 'a')
+            if self.json_lines:
+                entry = {
+                    'time': datetime.fromtimestamp(record.created).isoformat(),
+                    'level': record.levelname,
+                    'device': record.name,
+                    'thread': record.threadName,
+                    'source': f"{record.module}:{record.lineno}",
+                    'message': strip_markup(record.getMessage()),
+                }
+                if getattr(record, 'suppressed', 0):
+                    entry['suppressed'] = record.suppressed
+                if record.exc_text:
+                    entry['exception'] = record.exc_text
+                f.write(json.dumps(entry) + "\n")
+            else:
+                f.write(self.plain.format(record) + "\n")
+            f.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        super().close()
+
+class ConsoleHandler(RichHandler):
+    def emit(self, record):
+        if getattr(record, 'suppressed', 0):
+            record = copy.copy(record)
+            record.msg = f"{record.getMessage()} [dim](+{record.suppressed} suppressed)[/dim]"
+            record.args = None
+        super().emit(record)
+
+def strip_markup(message):
+    try:
+        return Text.from_markup(message).plain
+    except Exception:
+        return message
+
+_handler = None
+_lock = threading.Lock()
+
+def get_handler(config):
+    """The shared queue handler for device loggers, starting the background listener on first use."""
+    global _handler
+    with _lock:
+        if _handler is None:
+            queue = SimpleQueue()
+            console_handler = ConsoleHandler(console=Console(), rich_tracebacks=True, markup=True, highlighter=None)
+            console_handler.setFormatter(CustomFormatter())
+            file_handler = DeviceFileHandler(config['log_dir'], json_lines=config['logging']['json_files'])
+            listener = QueueListener(queue, console_handler, file_handler, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop) # flushes what's left in the queue
+
+            _handler = DeferredQueueHandler(queue)
+            _handler.addFilter(RateLimitFilter(config['logging']['debug_rate_limit']))
+        return _handler
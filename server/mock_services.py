@@ -0,0 +1,255 @@
+import io
+import json
+import random
+import re
+import threading
+import time
+import traceback
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import fire
+import numpy as np
+import yaml
+from rich import print
+
+# Local stand-ins for OpenAI, ElevenLabs, Maubot and Home Assistant with configurable latency, jitter, errors and
+# streaming, so the response path can be benchmarked offline & reproducibly. Settings are under `mocks` in config.yaml.
+#   python mock_services.py                 # all services
+#   python server.py --mocks --mb --ha      # point the server at them
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # needed for chunked streaming
+    settings = {}
+    rng = random.Random()
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        try:
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+
+            time.sleep(self.delay())
+            if self.rng.random() < self.settings['error_rate']:
+                status = self.rng.choice([429, 500, 503])
+                return self.send_json({'error': {'message': f"Injected error {status}"}}, status)
+            self.route(method, url.path, query, body)
+        except Exception:
+            self.send_json({'error': traceback.format_exc()}, 500)
+
+    def delay(self):
+        # base latency plus half-normal jitter gives a realistic tail
+        return max(0.0, self.settings['latency'] + abs(self.rng.gauss(0, self.settings['jitter'])))
+
+    def route(self, method, path, query, body):
+        self.send_json({'error': f"No route for {method} {path}"}, 404)
+
+    def send_json(self, obj, status=200):
+        payload = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_chunks(self, chunks, content_type, delay):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+            time.sleep(delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+class OpenAIHandler(MockHandler):
+    # which function to call when the user mentions a keyword, with plausible arguments
+    FUNCTION_KEYWORDS = {
+        'get_messages': (['message', 'messages', 'text'], {'recency': {'value': 1, 'unit': 'days'}}),
+        'reply_message': (['reply', 'respond'], {'index': '1', 'message': "Sounds good, see you then!"}),
+        'control_light': (['light', 'lights', 'lamp'], {'entity_id': ['light.living_room'], 'brightness': 128}),
+        'add_note': (['remember', 'note'], {'note': "Mock note"}),
+        'get_notes': (['notes'], {'day': 'today'}),
+    }
+
+    def route(self, method, path, query, body):
+        if method == 'POST' and path.endswith('/chat/completions'):
+            return self.chat_completion(body)
+        super().route(method, path, query, body)
+
+    def chat_completion(self, body):
+        messages = body.get('messages', [])
+        message = {'role': 'assistant', 'content': None}
+        function_call = self.pick_function(messages, body.get('functions') or [])
+        if function_call:
+            message['function_call'] = function_call
+        elif messages and messages[0]['content'].startswith("Summarize"):
+            message['content'] = "The user asked a few questions about their messages and lights."
+        else:
+            last = messages[-1] if messages else {}
+            about = "that" if last.get('role') == 'function' else f"\"{(last.get('content') or '')[:40]}\""
+            message['content'] = f"This is a mock response about {about}, kept nice and short."
+
+        if body.get('stream'):
+            return self.stream_completion(body, message)
+
+        prompt_tokens = sum(len(m.get('content') or '') for m in messages) // 4
+        completion_tokens = len(message['content'] or '') // 4 + 10
+        self.send_json({
+            'id': f"chatcmpl-mock{self.rng.randrange(1 << 30)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': message, 'finish_reason': 'function_call' if function_call else 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+    def pick_function(self, messages, functions):
+        if not messages or messages[-1]['role'] != 'user':
+            return None
+        words = set(re.findall(r"[a-z]+", messages[-1]['content'].lower()))
+        available = {f['name'] for f in functions}
+        for name, (keywords, arguments) in self.FUNCTION_KEYWORDS.items():
+            if name in available and words & set(keywords):
+                return {'name': name, 'arguments': json.dumps(arguments)}
+        return None
+
+    def stream_completion(self, body, message):
+        def event(delta, finish_reason=None):
+            chunk = {
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': body.get('model', 'mock'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n".encode()
+
+        events = [event({'role': 'assistant'})]
+        if message.get('function_call'):
+            events.append(event({'function_call': message['function_call']}))
+        else:
+            events += [event({'content': word + " "}) for word in message['content'].split(" ")]
+        events += [event({}, 'function_call' if message.get('function_call') else 'stop'), b"data: [DONE]\n\n"]
+        self.send_chunks(events, 'text/event-stream', self.settings['stream_chunk_delay'])
+
+class ElevenLabsHandler(MockHandler):
+    def route(self, method, path, query, body):
+        if method == 'GET' and path.endswith('/voices'):
+            return self.send_json({'voices': [
+                {'voice_id': f"mock-{name.lower()}", 'name': name, 'category': 'cloned'} for name in self.settings['voices']
+            ]})
+        if method == 'POST' and '/text-to-speech/' in path:
+            return self.text_to_speech(query, body)
+        super().route(method, path, query, body)
+
+    def text_to_speech(self, query, body):
+        output_format = query.get('output_format', 'mp3_44100_128')
+        rate = int(output_format.split('_')[1])
+        seconds = max(0.5, len(body.get('text', '')) * self.settings['seconds_per_char'])
+        t = np.arange(int(seconds * rate)) / rate
+        # a quiet warbling tone so playback is audible but distinguishable from real speech
+        samples = (0.2 * np.sin(2 * np.pi * (220 + 40 * np.sin(2 * np.pi * 3 * t)) * t) * 32767).astype(np.int16).tobytes()
+        if output_format.startswith('pcm_'):
+            data, content_type = samples, 'application/octet-stream'
+        else: # no mp3 encoder here, ffmpeg detects WAV content regardless of the file extension
+            data, content_type = wav_bytes(samples, rate), 'audio/mpeg'
+
+        chunk = self.settings['stream_chunk_bytes']
+        self.send_chunks([data[i:i + chunk] for i in range(0, len(data), chunk)], content_type, self.settings['stream_chunk_delay'])
+
+class MaubotHandler(MockHandler):
+    SENDERS = [('Alice', 'WhatsApp'), ('Bob', 'Signal'), ('Carol', 'Discord'), ('Dave', 'iMessage')]
+
+    def route(self, method, path, query, body):
+        if method == 'GET' and path.endswith('/messages'):
+            return self.send_json(self.messages(query))
+        if method == 'POST' and path.endswith('/messages'):
+            return self.send_json({'event_id': f"$mock{self.rng.randrange(1 << 30)}", 'room_id': body.get('room_id')})
+        super().route(method, path, query, body)
+
+    def messages(self, query):
+        now = int(time.time() * 1000)
+        since = int(query.get('since', now - 86400000))
+        messages = []
+        for i in range(self.settings['message_count']):
+            sender, source = self.SENDERS[i % len(self.SENDERS)]
+            messages.append({
+                'room_id': f"!room{i}:mock",
+                'from': sender,
+                'source': source,
+                'timestamp': now - (i + 1) * max(1, (now - since) // (self.settings['message_count'] + 1)),
+                'participants': 1 + i % 3,
+                'message': f"Hey, this is mock message number {i + 1}. Are we still on for later?",
+            })
+        if query.get('source'):
+            messages = [m for m in messages if m['source'].lower() == query['source'].lower()]
+        if query.get('sender'):
+            messages = [m for m in messages if query['sender'].lower() in m['from'].lower()]
+        return messages
+
+class HomeAssistantHandler(MockHandler):
+    def route(self, method, path, query, body):
+        if method == 'GET' and path.endswith('/api/states'):
+            return self.send_json([
+                {'entity_id': entity_id, 'state': 'on' if i % 2 else 'off', 'attributes': {}}
+                for i, entity_id in enumerate(self.settings['lights'])
+            ])
+        if method == 'POST' and path.endswith('/api/services/light/turn_on'):
+            return self.send_json([{'entity_id': e, 'state': 'on'} for e in body.get('entity_id', [])])
+        super().route(method, path, query, body)
+
+def wav_bytes(pcm, rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+HANDLERS = {
+    'openai': OpenAIHandler,
+    'elevenlabs': ElevenLabsHandler,
+    'maubot': MaubotHandler,
+    'home_assistant': HomeAssistantHandler,
+}
+
+def serve(name, config):
+    settings = config['mocks'][name]
+    handler = type(HANDLERS[name].__name__, (HANDLERS[name],), {
+        'settings': settings,
+        'rng': random.Random(config['mocks']['seed']), # seeded for reproducible latency/error sequences
+    })
+    server = ThreadingHTTPServer((config['mocks']['host'], settings['port']), handler)
+    print(f"🧪 Mock {name} on http://{config['mocks']['host']}:{settings['port']} "
+          f"[dim](latency {settings['latency']}s ± {settings['jitter']}s, error rate {settings['error_rate']})[/]")
+    threading.Thread(target=server.serve_forever, daemon=True, name=f"mock-{name}").start()
+    return server
+
+def main(only=None, config_file='config.yaml'):
+    with open(config_file, 'r') as f:
+        config = yaml.safe_load(f)
+    names = [only] if isinstance(only, str) else (only or list(HANDLERS))
+    for name in names:
+        serve(name, config)
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,130 @@
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from rich import print
+
+# Runtime-toggleable profiling: a sampling profiler over all threads that writes folded stacks
+# (for flamegraph.pl, speedscope, inferno...), and hot-path timers that are a no-op unless enabled.
+
+timers_enabled = False
+_stats = {} # name -> [count, total seconds, max seconds]
+_stats_lock = threading.Lock()
+_null = contextlib.nullcontext()
+
+class _Timer:
+    __slots__ = ('name', 'tic')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.tic = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.tic
+        with _stats_lock:
+            stat = _stats.get(self.name)
+            if stat is None:
+                _stats[self.name] = [1, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                stat[2] = max(stat[2], elapsed)
+
+def timed(name):
+    """Time a block under `name` when timers are enabled, e.g. `with timed("vad"): ...`"""
+    return _Timer(name) if timers_enabled else _null
+
+def set_timers(enabled):
+    global timers_enabled
+    timers_enabled = enabled
+
+def timer_stats(reset=False):
+    with _stats_lock:
+        stats = {
+            name: {'count': c, 'total_ms': total * 1000, 'mean_ms': total / c * 1000, 'max_ms': mx * 1000}
+            for name, (c, total, mx) in _stats.items()
+        }
+        if reset:
+            _stats.clear()
+    return stats
+
+def print_timer_stats():
+    stats = timer_stats()
+    if not stats:
+        print("⏱️  No timer stats" + ("" if timers_enabled else " (timers disabled)"))
+        return
+    print("\n⏱️  Hot-path timers:")
+    for name, s in sorted(stats.items(), key=lambda x: -x[1]['total_ms']):
+        print(f"  {name:<20} n={s['count']:<8} total={s['total_ms']:9.1f}ms mean={s['mean_ms']:7.3f}ms max={s['max_ms']:7.2f}ms")
+
+class SamplingProfiler:
+    def __init__(self, config):
+        self.config = config
+        self.running = threading.Event()
+
+    def start(self, seconds=None):
+        """Sample all threads for `seconds` in the background, returns False if already running."""
+        if self.running.is_set():
+            return False
+        self.running.set()
+        seconds = seconds or self.config['profiling']['duration']
+        threading.Thread(target=self.run, args=(seconds,), daemon=True, name="profiler").start()
+        return True
+
+    def run(self, seconds):
+        interval = self.config['profiling']['sample_interval']
+        names = {}
+        stacks = Counter()
+        me = threading.get_ident()
+        end = time.time() + seconds
+        print(f"🔬 Profiling all threads for {seconds}s")
+        try:
+            while time.time() < end:
+                for t in threading.enumerate():
+                    names[t.ident] = t.name
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+
+            fname = os.path.join(self.config['log_dir'], f"profile_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.folded")
+            with open(fname, 'w') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"🔬 Wrote {sum(stacks.values())} samples to [bold]{fname}[/] (e.g. flamegraph.pl {fname} > profile.svg)")
+        finally:
+            self.running.clear()
+
+def install_signal_handlers(profiler):
+    """SIGUSR1 samples all threads for `profiling.duration` seconds, SIGUSR2 toggles the hot-path timers (printing stats when turned off)."""
+    if not hasattr(signal, 'SIGUSR1'): # not on Windows
+        return
+
+    def on_usr1(signum, frame):
+        profiler.start()
+
+    def on_usr2(signum, frame):
+        if timers_enabled:
+            set_timers(False)
+            print_timer_stats()
+        else:
+            timer_stats(reset=True)
+            set_timers(True)
+            print("⏱️  Hot-path timers enabled")
+
+    signal.signal(signal.SIGUSR1, on_usr1)
+    signal.signal(signal.SIGUSR2, on_usr2)
@@ -1,6 +1,7 @@
 import atexit
 import json
 import os
+import random
 import socket
 import sys
 import subprocess
@@ -9,46 +10,71 @@ import time
 import traceback
 import warnings
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from queue import Queue
 
 import numpy as np
 import fire
-import whisper
-from scipy.io.wavfile import write
 from rich import print
 from rich.traceback import install
 
 install(show_locals=False)
 
-from devices import DeviceManager
-from elevenlabs import ElevenLabs
-from llm import OpenAIFunctionCalling
+from admin import AdminServer
+from cluster import Frontend, worker_control
+from devices import DeviceManager, frame_energy
+from jobs import Cancelled, ResponseJob
+from profiler import SamplingProfiler, install_signal_handlers, set_timers, timed
+from startup import Startup
 
 # listen to UDP packets from devices & use Voice Activity Detection (VAD) to add spoken segments to transcribe queue
-def listen_detect(queue, manager, config):
+def listen_detect(queue, manager, startup, config):
+    from scipy.io.wavfile import write
 
     UDP_ADDR_PORT = (config['udp']['ip'], config['udp']['port'])
     CHUNK_BYTES = config['mic']['chunk'] * np.dtype(config['mic']['format']).itemsize
     RATE = config['mic']['rate']
     FRAMES_PER_SECOND = int(RATE / config['mic']['chunk'])
     MIC_FORMAT = np.dtype(config['mic']['format'])
+    BATCH_SIZE = config['vad']['batch_size'] if hasattr(socket, 'MSG_DONTWAIT') else 1
+    FORWARDED_BYTES = CHUNK_BYTES + 4 # audio forwarded by a cluster frontend is prefixed with the device's IPv4 address
     
     while True:
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
                 s.bind(UDP_ADDR_PORT)
                 while True:
-                    data, addr = s.recvfrom(CHUNK_BYTES)
-                    device = manager.get_device_from_ip(
-                        addr[0]
-                    )  # what device sent this packet? (Needs to be added from multicast_listen)
-                    
-                    if device:
-                        frame = np.frombuffer(data, dtype=MIC_FORMAT)
-                        is_speech = device.vad.vad.is_speech(data, RATE)
-
-                        device.update_LEDs(is_speech)  # Visualize speaking (and server listening) on LED's
+                    packets = receive_batch(s, FORWARDED_BYTES, BATCH_SIZE)
+                    frames = []
+                    for data, addr in packets:
+                        ip = addr[0]
+                        if len(data) == FORWARDED_BYTES:
+                            ip, data = socket.inet_ntoa(data[:4]), data[4:]
+                        device = manager.get_device_from_ip(
+                            ip
+                        )  # what device sent this packet? (Needs to be added from multicast_listen)
+                        if device and len(data) == CHUNK_BYTES:
+                            frames.append((device, data))
+                    if not frames:
+                        continue
+
+                    # energy for all frames in one vectorized pass, so webrtcvad only runs on frames that might be speech
+                    pcm = np.frombuffer(b"".join(data for _, data in frames), dtype=MIC_FORMAT).reshape(len(frames), -1)
+                    with timed("vad.energy"):
+                        rms, zcr = frame_energy(pcm)
+
+                    for i, (device, data) in enumerate(frames):
+                        frame = pcm[i]
+                        playing = device.is_playing() # mic only streams during playback when barge-in is enabled
+                        # the device's own speaker isn't the user speaking, and shouldn't end up in a recording either
+                        echo = playing and device.echo.is_echo(rms[i])
+                        with timed("vad.is_speech"):
+                            is_speech = not echo and device.vad.is_speech(data, rms[i], zcr[i])
+
+                        if not playing: # LEDs show the audio level during playback
+                            with timed("update_LEDs"):
+                                device.update_LEDs(is_speech)  # Visualize speaking (and server listening) on LED's
                         device.vad.window.append(is_speech)  # Running window to calculate ratio of frames that are classified as speech
 
                         if (len(device.vad.window) == device.vad.window.maxlen):  # wait till full
@@ -56,13 +82,17 @@ def listen_detect(queue, manager, config):
 
                             if not device.vad.recording:
                                 # Keep pre-buffering until VAD ratio is enough to indicate speech
-                                device.vad.pre_buffer.append(frame)
-                                if ratio > config['vad']['start_ratio']:
+                                if not echo:
+                                    device.vad.pre_buffer.append(frame)
+                                # the mic also hears the speaker during playback, so interrupting needs more of the window to be speech
+                                if ratio > (config['barge_in']['start_ratio'] if playing else config['vad']['start_ratio']):
                                     device.vad.fname = f"output_{device.hostname}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
                                     device.log.debug(
-                                        f"🔴 Started recording. VAD window: {device.vad.visualization()}"
+                                        "🔴 Started recording. VAD window: %s", device.vad.visualization()
                                     )
                                     device.vad.recording = True
+                                    if config['barge_in']['enabled']:
+                                        device.cancel_response("new speech") # user is talking over or re-asking
                                     device.vad.buffer.extend(device.vad.pre_buffer)
                                     device.vad.pre_buffer.clear()
                             else:
@@ -74,14 +104,15 @@ def listen_detect(queue, manager, config):
                                     % int(FRAMES_PER_SECOND * config['transcribe']['period'])
                                     == 0
                                 ):
-                                    audio_data = np.frombuffer(
-                                        b"".join(list(device.vad.buffer)),
-                                        dtype=MIC_FORMAT,
-                                    )
+                                    with timed("buffer.join"):
+                                        audio_data = np.frombuffer(
+                                            b"".join(list(device.vad.buffer)),
+                                            dtype=MIC_FORMAT,
+                                        )
                                     device.log.debug(
                                         f"Adding incomplete phrase to transcribe queue"
                                     )
-                                    queue.put([audio_data, device, False])
+                                    queue.put([audio_data, device, False, device.vad.fname])
 
                                 # Speech has stopped
                                 if ratio < config['vad']['silence_stopping_ratio']:
@@ -90,11 +121,19 @@ def listen_detect(queue, manager, config):
                                         device.vad.silence_count
                                         > config['vad']['silence_stopping_time'] * FRAMES_PER_SECOND
                                     ):
-                                        audio_data = np.frombuffer(
-                                            b"".join(list(device.vad.buffer)),
-                                            dtype=MIC_FORMAT,
-                                        )
-                                        queue.put([audio_data, device, True])
+                                        with timed("buffer.join"):
+                                            audio_data = np.frombuffer(
+                                                b"".join(list(device.vad.buffer)),
+                                                dtype=MIC_FORMAT,
+                                            )
+                                        queue.put([audio_data, device, True, device.vad.fname])
+                                        if not startup.is_ready():
+                                            device.log.warning("Server still starting, utterance queued")
+                                            if config['starting_wav'] and device.hostname not in startup.notified:
+                                                startup.notified.add(device.hostname) # only tell each device once
+                                                threading.Thread(
+                                                    target=device.send_audio, args=(config['starting_wav'],), kwargs={'mic_timeout': 30, 'cache': True}, daemon=True
+                                                ).start()
                                         audio_data = (
                                             audio_data - np.mean(audio_data)
                                         ).astype(np.int16)
@@ -119,26 +158,34 @@ def listen_detect(queue, manager, config):
                 s.close()
 
 
+# block for one packet, then take up to batch_size - 1 more that are already waiting
+def receive_batch(s, chunk_bytes, batch_size):
+    packets = [s.recvfrom(chunk_bytes)]
+    while len(packets) < batch_size:
+        try:
+            packets.append(s.recvfrom(chunk_bytes, socket.MSG_DONTWAIT))
+        except BlockingIOError:
+            break
+    return packets
+
+
 # transcribe audio segments from queue, get LLM response, and send TTS to device
-def transcribe_respond(queue, tts, llm, config):
-    tic = time.time()
-    audio_model = whisper.load_model(config['transcribe']['whisper_model'])
-    print(
-        f"\n🎤 Loaded Whisper model [bold]{config['transcribe']['whisper_model']}[/] in {time.time()-tic:.3f} seconds\n"
-    )
+def transcribe_respond(queue, startup, config):
+    # utterances queue up while these finish loading
+    whisper = startup.get('whisper')
+    tts = startup.get('tts')
+    llm = startup.get('llm')
+    # LLM/TTS run off this thread so transcription of other devices (and barge-in) isn't blocked behind a response
+    responders = ThreadPoolExecutor(max_workers=config['barge_in']['workers'], thread_name_prefix="respond")
 
     while True:
         while queue.empty():
             time.sleep(0.01)
 
-        data, device, last_one = queue.get()
+        data, device, last_one, segment_id = queue.get()
         tic = time.time()
 
-        with warnings.catch_warnings():  # stop repeated warnings from Whisper
-            warnings.simplefilter("ignore")
-            res = audio_model.transcribe(
-                data.astype(np.float32) / 32768.0, initial_prompt=device.last_response
-            )
+        res = transcribe_segment(whisper.model, device, data, last_one, segment_id, config)
 
         if "text" in res:
             if res["segments"]:
@@ -150,18 +197,11 @@ def transcribe_respond(queue, tts, llm, config):
                         + ("" if last_one else "[INCOMPLETE]")
                     )
                     if last_one:
-                        device.stop_listening()  # while server is "thinking"
-                        text_response = llm.askGPT(device, new_res)
-                        device.last_response = text_response  # use this as prompt for next Whisper transcription
-                        wav_fname = tts.text_to_speech(
-                            device, text_response, path_name=config['audio_dir']
-                        )
-                        if wav_fname:
-                            device.send_audio(wav_fname, mic_timeout=10)
-                        else:
-                            # TODO: send placeholder response saying there's an issue
-                            device.log.warning(f"No audio sent")
-                        device.prune_messages()
+                        if config['barge_in']['enabled']:
+                            device.cancel_response("new request")
+                        job = ResponseJob(device, new_res, previous=device.job)
+                        device.job = job
+                        responders.submit(respond, job, tts, llm, config)
                 else:
                     device.log.debug(
                         f"[NO SPEECH] {res['text'].strip()} ({res['segments'][0]['no_speech_prob']:.2f})"
@@ -173,8 +213,103 @@ def transcribe_respond(queue, tts, llm, config):
         queue.task_done()
 
 
+def transcribe_segment(audio_model, device, data, last_one, segment_id, config):
+    # a partial of this same utterance may already cover most of the audio
+    partial = device.partial if (config['transcribe']['reuse_partials'] and device.partial and device.partial['id'] == segment_id) else None
+    if last_one and partial and len(data) == partial['samples']:
+        device.log.debug("Final segment is the same as the last partial, reusing its transcription")
+        res = partial['res']
+    elif last_one and partial and len(partial['res']['segments']) > 1:
+        res = transcribe_tail(audio_model, device, data, partial, config)
+    else:
+        with warnings.catch_warnings(), timed("whisper"):  # stop repeated warnings from Whisper
+            warnings.simplefilter("ignore")
+            res = audio_model.transcribe(
+                data.astype(np.float32) / 32768.0, initial_prompt=device.last_response
+            )
+    device.partial = None if last_one else {'id': segment_id, 'samples': len(data), 'res': res}
+    return res
+
+
+# only decode audio after the partial's stable segments (all but its last, which may end mid-word), prompted with their text
+def transcribe_tail(audio_model, device, data, partial, config):
+    stable = partial['res']['segments'][:-1]
+    stable_text = "".join(s['text'] for s in stable).strip()
+    offset = min(int(stable[-1]['end'] * config['mic']['rate']), partial['samples'])
+    device.log.debug(f"Reusing {offset / config['mic']['rate']:.1f}s of partial transcription, decoding {(len(data) - offset) / config['mic']['rate']:.1f}s")
+
+    prompt = f"{device.last_response} {stable_text}" if device.last_response else stable_text
+    with warnings.catch_warnings(), timed("whisper"):
+        warnings.simplefilter("ignore")
+        tail = audio_model.transcribe(data[offset:].astype(np.float32) / 32768.0, initial_prompt=prompt)
+    return {
+        'text': f"{stable_text} {tail.get('text', '').strip()}".strip(),
+        'segments': stable + tail.get('segments', []),
+    }
+
+
+# get LLM response and send TTS to device, checking for cancellation (barge-in) between each step
+def respond(job, tts, llm, config):
+    device = job.device
+    filler = None
+    if config['filler']['enabled']:
+        filler = threading.Timer(config['filler']['threshold'], play_filler, args=(job, config))
+        filler.start()
+    try:
+        if job.previous:
+            # a cancelled job's request can't be aborted, wait for it to roll back its messages before adding ours
+            job.previous.done.wait()
+            job.previous = None
+        job.check()
+        job.message_count = len(device.messages)
+        # while server is "thinking", the mic is only kept open to re-ask when a new request can cancel this one
+        device.stop_listening(config['barge_in']['thinking_mic_timeout'] if config['barge_in']['enabled'] else 0)
+        with timed("llm"):
+            text_response = llm.askGPT(device, job.text, job=job)
+        job.check()
+        device.last_response = text_response  # use this as prompt for next Whisper transcription
+        with timed("tts"):
+            wav_fname = tts.text_to_speech(
+                device, text_response, path_name=config['audio_dir'], job=job
+            )
+        job.check()
+        if wav_fname:
+            with job.lock:
+                if job.playback: # filler already playing, splice the response onto the same stream
+                    job.playback.feed(device.load_audio(wav_fname)).finish()
+                else:
+                    job.playback = device.send_audio(wav_fname, mic_timeout=10, listen=config['barge_in']['enabled'])
+        else:
+            # TODO: send placeholder response saying there's an issue
+            device.log.warning(f"No audio sent")
+        device.prune_messages(llm.summarize_async if config['llm']['summarize'] else None)
+    except Cancelled:
+        device.log.info(f"Cancelled response to: {job.text}")
+        if job.message_count is not None:
+            device.truncate_messages(job.message_count) # drop the unanswered question & any partial answer
+    except Exception:
+        device.log.error(traceback.format_exc())
+    finally:
+        if filler:
+            filler.cancel()
+        with job.lock:
+            if job.playback:
+                job.playback.finish() # no-op if the response was spliced, otherwise ends the filler stream
+        job.done.set()
+
+
+# mask a slow response (e.g. function calls) with a short pre-rendered sound, left open for the response to follow
+def play_filler(job, config):
+    with job.lock:
+        if job.cancelled.is_set() or job.playback:
+            return
+        fname = random.choice(config['filler']['wavs'])
+        job.device.log.debug(f"Response is slow, playing filler {fname}")
+        job.playback = job.device.send_audio(fname, mic_timeout=10, cache=True, finish=False, listen=config['barge_in']['enabled'])
+
+
 # Listen to new devices joining the network and send greeting, which prevents the need to manually program in the server IP
-def multicast_listen(manager, config):
+def multicast_listen(manager, config, on_announce=None):
     mcast_sock = None
     try:
         mcast_sock = socket.socket(
@@ -196,8 +331,11 @@ def multicast_listen(manager, config):
                 f"[blink]👋[/] Received [bold]{greet_msg}[/] from {address[0]}:{address[1]}"
             )
             host_name = greet_msg.split(" ")[0]
+            if on_announce: # cluster frontend hands the device to a worker instead
+                on_announce(host_name, address[0])
+                continue
             device = manager.create_device(host_name, address[0])
-            device.send_audio(config['greeting_wav'], volume=14, fade=10, mic_timeout=30)
+            device.send_audio(config['greeting_wav'], volume=14, fade=10, mic_timeout=30, cache=True)
 
     except Exception:
         print(traceback.format_exc())
@@ -206,10 +344,120 @@ def multicast_listen(manager, config):
             print("Closing multicast socket")
             mcast_sock.close()
 
+class WhisperModel:
+    """Holds the current Whisper model, which can be swapped at runtime without stopping transcription."""
+    def __init__(self, config):
+        self.config = config
+        self.loading = None
+        self.lock = threading.Lock() # swaps can be requested from several admin API threads
+        self.name = config['transcribe']['whisper_model']
+        self.model = self.load(self.name)
+
+    def load(self, name):
+        import whisper # slow import (torch), so only when loading the model
+
+        tic = time.time()
+        audio_model = whisper.load_model(name)
+        print(
+            f"\n🎤 Loaded Whisper model [bold]{name}[/] in {time.time()-tic:.3f} seconds\n"
+        )
+        return audio_model
+
+    def swap(self, name):
+        with self.lock:
+            if self.loading:
+                raise ValueError(f"Already loading Whisper model {self.loading}")
+            self.loading = name
+
+        def run():
+            try:
+                model = self.load(name)
+                self.model, self.name = model, name # transcriptions in flight finish on the old model
+                self.config['transcribe']['whisper_model'] = name
+            except Exception:
+                print(f"[bold red]Failed to load Whisper model {name}[/]\n{traceback.format_exc()}")
+            finally:
+                self.loading = None
+
+        threading.Thread(target=run, daemon=True).start()
+
+def load_tts(config):
+    from elevenlabs import ElevenLabs
+    return ElevenLabs(config)
+
+def load_llm(config):
+    from llm import OpenAIFunctionCalling
+    return OpenAIFunctionCalling(config)
+
 class ConfigUpdater:
+    # config read as it's used, so it can be changed while running (admin API). The rest is only read at startup
+    HOT_KEYS = [
+        'use_notes', 'use_maubot', 'use_home_assistant', 'elevenlabs_default_voice', 'maubot.send_replies', 'llm.*', 'led.*',
+        'vad.window_length', 'vad.pre_buffer_length', 'vad.silence_stopping_ratio', 'vad.silence_stopping_time', 'vad.start_ratio', 'vad.pregate.*',
+        'transcribe.period', 'transcribe.no_speech_prob', 'transcribe.reuse_partials',
+        'barge_in.enabled', 'barge_in.thinking_mic_timeout', 'barge_in.start_ratio', 'barge_in.echo_margin', 'barge_in.echo_window',
+        'barge_in.echo_tail', 'barge_in.echo_warmup', 'barge_in.echo_adapt_rate', 'filler.threshold', 'downlink.*',
+        'profiling.duration', 'profiling.sample_interval',
+    ]
+    # (min, max) of numbers, any others can't be negative. Minimums above 0 are for values divided by or used as a loop period
+    BOUNDS = {
+        'vad.window_length': (0.03, None), # at least one frame
+        'vad.silence_stopping_ratio': (0, 1),
+        'vad.start_ratio': (0, 1),
+        'vad.pregate.max_zcr': (0, 1),
+        'vad.pregate.adapt_rate': (0, 1),
+        'transcribe.period': (0.03, None),
+        'transcribe.no_speech_prob': (0, 1),
+        'barge_in.thinking_mic_timeout': (0, 65535), # 2 bytes in the header
+        'barge_in.start_ratio': (0, 1),
+        'barge_in.echo_adapt_rate': (0, 1),
+        'led.power': (0, 255),
+        'downlink.chunk_ms': (1, None),
+        'downlink.connect_timeout': (0.1, None),
+        'downlink.write_timeout': (0.1, None),
+        'profiling.sample_interval': (0.001, None),
+    }
+
     def __init__(self, config):
         self.config = config
 
+    def validate(self, path, value):
+        # dotted path into config, e.g. "vad.start_ratio", returns where to set it & the value coerced to the current type
+        if not any(path == k or (k.endswith('.*') and path.startswith(k[:-1])) for k in self.HOT_KEYS):
+            raise KeyError(f"{path} can't be changed while running")
+        *parents, key = path.split('.')
+        node = self.config
+        for p in parents:
+            node = node.get(p) if isinstance(node, dict) else None
+        if not isinstance(node, dict) or key not in node or isinstance(node[key], dict):
+            raise KeyError(f"Unknown config key: {path}")
+        current = node[key]
+        if isinstance(current, bool):
+            if not isinstance(value, bool):
+                raise TypeError(f"{path} should be true or false")
+        elif isinstance(current, (int, float)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise TypeError(f"{path} should be a number")
+            if isinstance(current, int):
+                if not float(value).is_integer():
+                    raise TypeError(f"{path} should be an integer")
+                value = int(value)
+            else:
+                value = float(value)
+            low, high = self.BOUNDS.get(path, (0, None))
+            if value < low or (high is not None and value > high):
+                raise ValueError(f"{path} should be between {low} and {high}" if high is not None else f"{path} should be at least {low}")
+        elif current is not None and not isinstance(value, type(current)):
+            raise TypeError(f"{path} should be a {type(current).__name__}")
+        return node, key, value
+
+    def validate_all(self, updates):
+        return [self.validate(path, value) for path, value in updates.items()]
+
+    def apply(self, validated):
+        for node, key, value in validated:
+            node[key] = value
+
     def update(self, **kwargs):
         if kwargs:
             print(f"\n🔥 Updating config with params: {kwargs}")
@@ -229,6 +477,20 @@ class ConfigUpdater:
                     self.config['elevenlabs_default_voice'] = value
                 elif key == 'send':
                     self.config['maubot']['send_replies'] = value
+                elif key == 'role':
+                    self.config['cluster']['role'] = value
+                elif key == 'worker_port':
+                    self.config['cluster']['worker_port'] = int(value)
+                elif key == 'frontend':
+                    self.config['cluster']['frontend'] = value
+                elif key == 'mocks': # use local stand-ins from mock_services.py
+                    mocks = self.config['mocks']
+                    base = f"http://{mocks['host']}"
+                    self.config['openai_api_base'] = f"{base}:{mocks['openai']['port']}/v1"
+                    self.config['elevenlabs_url'] = f"{base}:{mocks['elevenlabs']['port']}/v1/"
+                    self.config['maubot']['url'] = f"{base}:{mocks['maubot']['port']}/"
+                    self.config['home_assistant_url'] = f"{base}:{mocks['home_assistant']['port']}/"
+                    self.config['voices_file'] = "voices_mock.json" # don't mix up with real cloned voices
                 else:
                     print(f"[blink red] Unknown config key:[/] {key} - see examples in {__file__}:{sys._getframe().f_lineno}")
 
@@ -251,8 +513,9 @@ def load_and_validate_config(filename):
             print(f"📂 [gold1]Creating [bold]{dir}[/]")
             os.makedirs(dir)
     
-    if not os.path.exists(os.path.join(config['audio_dir'], config['greeting_wav'])):
-        raise FileNotFoundError(f"File {config['greeting_wav']} does not exist in {config['audio_dir']}")
+    for wav in [config['greeting_wav'], config['starting_wav']] + (config['filler']['wavs'] if config['filler']['enabled'] else []):
+        if wav and not os.path.exists(os.path.join(config['audio_dir'], wav)):
+            raise FileNotFoundError(f"File {wav} does not exist in {config['audio_dir']}")
     
     assert config['mic']['chunk'] * np.dtype(config['mic']['format']).itemsize < 1400, "UDP packets should probably be less than 1400 bytes to avoid fragmentation!"
     
@@ -273,19 +536,67 @@ def main(**kwargs):
 
     show_git_hash()
 
-    queue = Queue()
-    manager = DeviceManager(config)
-    tts = ElevenLabs(config)
-    llm = OpenAIFunctionCalling(config)
+    config_updater = ConfigUpdater(config)
+    profiler = SamplingProfiler(config)
+    set_timers(config['profiling']['timers'])
+    install_signal_handlers(profiler)
 
-    atexit.register(manager.save_to_json)
+    role = config['cluster']['role']
+    if role == 'frontend':
+        return run_frontend(config, kwargs)
+    if role == 'worker':
+        config['udp']['port'] = config['cluster']['worker_port'] # receives audio forwarded by the frontend (and directly from devices it contacted)
+        print(f"\n🧵 Running as worker on UDP port {config['udp']['port']}, frontend at {config['cluster']['frontend']}")
+
+    queue = Queue()
+    startup = Startup()
+    startup.start({
+        'devices': (DeviceManager, (config,)),
+        'whisper': (WhisperModel, (config,)),
+        'tts': (load_tts, (config,)),
+        'llm': (load_llm, (config,)),
+    })
+
+    # devices are needed to receive audio, everything else can finish loading while utterances are queued
+    manager = startup.get('devices')
+    atexit.register(manager.close)
 
     threads = [
-        threading.Thread(target=listen_detect, args=(queue, manager, config), daemon=True),
-        threading.Thread(target=transcribe_respond, args=(queue, tts, llm, config), daemon=True),
-        threading.Thread(target=multicast_listen, args=(manager,config), daemon=True),
+        threading.Thread(target=listen_detect, args=(queue, manager, startup, config), daemon=True),
+        threading.Thread(target=transcribe_respond, args=(queue, startup, config), daemon=True),
     ]
+    if role == 'worker':
+        threads.append(threading.Thread(target=worker_control, args=(manager, config), daemon=True))
+    else:
+        threads.append(threading.Thread(target=multicast_listen, args=(manager,config), daemon=True))
+
+    if config['admin']['enabled']:
+        admin = AdminServer(config, manager, queue, startup, config_updater, profiler)
+        admin.serve(0 if role == 'worker' else config['admin']['port']) # workers pick a free port, printed on startup
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while not startup.failed.wait(1):
+            pass
+    except KeyboardInterrupt:
+        return
+    print(f"[bold red]Exiting as {', '.join(startup.failures)} failed to start[/]")
+    sys.exit(1)
 
+def run_frontend(config, overrides):
+    frontend = Frontend(config, overrides)
+    atexit.register(frontend.close)
+    print(f"\n🧭 Running as frontend, forwarding audio to workers (control port {config['cluster']['control_port']})")
+    frontend.spawn_local_workers()
+
+    threads = [
+        threading.Thread(target=frontend.control_listen, daemon=True),
+        threading.Thread(target=frontend.monitor, daemon=True),
+        threading.Thread(target=frontend.forward_audio, daemon=True),
+        threading.Thread(target=multicast_listen, args=(None, config, frontend.announce), daemon=True),
+    ]
     for thread in threads:
         thread.start()
 
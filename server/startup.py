@@ -0,0 +1,68 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from rich import print
+
+class Startup:
+    """
+    Initializes independent server components concurrently and tracks when each is ready.
+    Threads that need a component block on `get`, everything else can start serving immediately.
+    If any component fails `failed` is set instead of `ready`, for the server to exit rather than run without it.
+    """
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.futures = {}
+        self.timeline = {}
+        self.t0 = time.time()
+        self.ready = threading.Event()
+        self.failed = threading.Event()
+        self.failures = []
+        self.lock = threading.Lock()
+        self.notified = set() # devices already told the server is still starting
+
+    def start(self, components):
+        # components: {name: (fn, args)}, all registered before any can complete so readiness covers every one
+        with self.lock:
+            for name, (fn, args) in components.items():
+                self.futures[name] = self.executor.submit(self.run, name, fn, *args)
+        for future in list(self.futures.values()):
+            future.add_done_callback(lambda _: self.check_ready())
+
+    def run(self, name, fn, *args):
+        tic = time.time()
+        try:
+            return fn(*args)
+        except Exception:
+            print(f"[bold red]Failed to start {name}[/]\n{traceback.format_exc()}")
+            raise
+        finally:
+            self.timeline[name] = (tic - self.t0, time.time() - self.t0)
+
+    def get(self, name, timeout=None):
+        return self.futures[name].result(timeout)
+
+    def is_ready(self, name=None):
+        if name is None:
+            return self.ready.is_set()
+        future = self.futures[name]
+        return future.done() and future.exception() is None
+
+    def check_ready(self):
+        with self.lock:
+            failures = [name for name, f in self.futures.items() if f.done() and f.exception()]
+            if failures and not self.failed.is_set():
+                self.failures = failures
+                self.failed.set()
+            elif not failures and all(f.done() for f in self.futures.values()) and not self.ready.is_set():
+                self.ready.set()
+                self.executor.shutdown(wait=False)
+                self.print_timeline()
+
+    def print_timeline(self):
+        total = max(end for _, end in self.timeline.values())
+        print(f"\n⏱️  Startup timeline ({total:.2f}s total):")
+        for name, (start, end) in sorted(self.timeline.items(), key=lambda x: x[1][0]):
+            status = "[red]failed[/]" if self.futures[name].exception() else "[green]ok[/]"
+            print(f"  {name:<10} {start:6.2f}s → {end:6.2f}s  [dim]({end - start:.2f}s)[/] {status}")
@@ -0,0 +1,123 @@
+import json
+import sqlite3
+import threading
+
+from rich import print
+
+class StateStore:
+    """
+    SQLite-backed store for devices and their conversation history.
+    Messages are appended as they are added so nothing is lost on a crash, and each device's history is only read on first use.
+    WAL mode lets local cluster workers share the file, but it doesn't work on network filesystems, so only share it on one host.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.path = config['state_db']
+        self.lock = threading.Lock() # one connection shared between the UDP, transcribe & multicast threads
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL") # only applies when creating a new database
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS devices (
+                hostname TEXT PRIMARY KEY,
+                ip_address TEXT,
+                voice TEXT,
+                summary TEXT
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hostname TEXT NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_hostname ON messages (hostname, id);
+        """)
+
+    def save_device(self, device):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO devices (hostname, ip_address, voice, summary) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hostname) DO UPDATE SET ip_address=excluded.ip_address, voice=excluded.voice, summary=excluded.summary",
+                (device.hostname, device.ip_address, device.voice, device.summary),
+            )
+
+    def load_devices(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT d.hostname, d.ip_address, d.voice, d.summary, COUNT(m.id) FROM devices d "
+                "LEFT JOIN messages m ON m.hostname = d.hostname GROUP BY d.hostname"
+            ).fetchall()
+        return [
+            {'hostname': r[0], 'ip_address': r[1], 'voice': r[2], 'summary': r[3], 'message_count': r[4]}
+            for r in rows
+        ]
+
+    def load_device(self, hostname):
+        with self.lock:
+            r = self.conn.execute("SELECT hostname, ip_address, voice, summary FROM devices WHERE hostname = ?", (hostname,)).fetchone()
+        return None if r is None else {'hostname': r[0], 'ip_address': r[1], 'voice': r[2], 'summary': r[3]}
+
+    def load_messages(self, hostname):
+        with self.lock:
+            rows = self.conn.execute("SELECT body FROM messages WHERE hostname = ? ORDER BY id", (hostname,)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def append_message(self, hostname, message):
+        with self.lock:
+            self.conn.execute("INSERT INTO messages (hostname, body) VALUES (?, ?)", (hostname, json.dumps(message)))
+
+    def replace_messages(self, hostname, messages):
+        # used after pruning/truncation, histories are short so rewriting one device's rows is cheap
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("DELETE FROM messages WHERE hostname = ?", (hostname,))
+                self.conn.executemany(
+                    "INSERT INTO messages (hostname, body) VALUES (?, ?)",
+                    [(hostname, json.dumps(m)) for m in messages],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def compact(self):
+        with self.lock:
+            self.conn.execute("PRAGMA incremental_vacuum")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] == 0
+
+    def import_json(self, fname):
+        # one-off migration from the devices.json previously written at exit, into an empty store only
+        with open(fname, 'r') as f:
+            json_devices = json.load(f)
+        with self.lock:
+            # takes the write lock before checking, so local cluster workers starting together don't each import
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.conn.execute("SELECT COUNT(*) FROM devices").fetchone()[0] > 0:
+                    self.conn.execute("ROLLBACK")
+                    return False
+                for hostname, data in json_devices.items():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO devices (hostname, ip_address, voice, summary) VALUES (?, ?, ?, ?)",
+                        (hostname, data['ip_address'], data.get('voice'), data.get('summary')),
+                    )
+                    self.conn.executemany(
+                        "INSERT INTO messages (hostname, body) VALUES (?, ?)",
+                        [(hostname, json.dumps(m)) for m in data.get('messages', [])[1:]], # system prompt is rebuilt from config
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        print(f"\n📦 Imported {len(json_devices)} devices from [bold]{fname}[/] into [bold]{self.path}[/]")
+        return True
+
+    def close(self):
+        self.compact()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,69 @@
+import copy
+import json
+
+import pytest
+
+from admin import AdminServer
+from server import ConfigUpdater
+from startup import Startup
+
+def test_hot_keys_are_coerced_to_their_type(config):
+    updater = ConfigUpdater(config)
+    updater.apply(updater.validate_all({'vad.start_ratio': 1, 'led.power': 40.0, 'barge_in.enabled': False}))
+    assert config['vad']['start_ratio'] == 1.0 and isinstance(config['vad']['start_ratio'], float)
+    assert config['led']['power'] == 40 and isinstance(config['led']['power'], int)
+    assert config['barge_in']['enabled'] is False
+
+@pytest.mark.parametrize('path, value, error', [
+    ('mic.rate', 8000, KeyError), # read once at startup
+    ('udp.port', 3005, KeyError),
+    ('barge_in.workers', 8, KeyError),
+    ('vad.nope', 1, KeyError),
+    ('led.power', 35.5, TypeError),
+    ('vad.start_ratio', "high", TypeError),
+    ('barge_in.enabled', 1, TypeError),
+    ('llm', {}, KeyError),
+    ('vad.window_length', 0, ValueError), # divides the window into frames
+    ('transcribe.period', 0, ValueError), # modulo of the frame count
+    ('downlink.chunk_ms', 0, ValueError), # would spin the downlink loop
+    ('vad.start_ratio', 1.5, ValueError),
+    ('barge_in.echo_adapt_rate', -0.1, ValueError),
+    ('led.power', 300, ValueError),
+    ('filler.threshold', -1, ValueError),
+])
+def test_invalid_updates_are_rejected(config, path, value, error):
+    with pytest.raises(error):
+        ConfigUpdater(config).validate(path, value)
+
+def test_batch_with_a_bad_key_changes_nothing(config, manager):
+    admin = AdminServer(config, manager, None, Startup(), ConfigUpdater(config), None)
+    before = copy.deepcopy(config)
+    with pytest.raises(KeyError):
+        admin.route('POST', '/config', {'vad.start_ratio': 0.5, 'mic.chunk': 960})
+    assert config == before
+
+    with pytest.raises(ValueError):
+        admin.route('POST', '/config', {'vad.start_ratio': 0.5, 'vad.window_length': 0})
+    assert config == before
+
+    status, result = admin.route('POST', '/config', {'vad.start_ratio': 0.5, 'led.power': 20})
+    assert status == 200 and result == {'applied': {'vad.start_ratio': 0.5, 'led.power': 20}}
+    assert config['vad']['start_ratio'] == 0.5
+
+def test_default_voice_is_checked_and_used_by_tts(tmp_path, monkeypatch, config, manager):
+    from elevenlabs import ElevenLabs
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "credentials.json").write_text("{}")
+    voices = {name: {'voice_id': f"id-{name}", 'name': name} for name in ["Samantha", "Rachel"]}
+    (tmp_path / config['voices_file']).write_text(json.dumps(voices))
+    startup = Startup()
+    startup.start({'tts': (ElevenLabs, (config,))})
+    tts = startup.get('tts')
+    admin = AdminServer(config, manager, None, startup, ConfigUpdater(config), None)
+
+    with pytest.raises(ValueError):
+        admin.route('POST', '/config', {'elevenlabs_default_voice': "Nobody"})
+    admin.route('POST', '/config', {'elevenlabs_default_voice': "Rachel"})
+    device = manager.create_device("onju-test", "127.0.0.1")
+    device.voice = "Nobody"
+    assert tts.get_voice_id(device) == "id-Rachel"
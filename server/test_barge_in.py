@@ -0,0 +1,163 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+import audio
+from jobs import ResponseJob
+from server import listen_detect, respond
+from conftest import voiced
+from devices import EchoGate
+from startup import Startup
+
+def test_speech_during_playback_cancels_response(tmp_path, config, fake_device, manager):
+    config['barge_in']['enabled'] = True
+    audio.write_wav(str(tmp_path / "response.wav"), bytes(config['mic']['rate'] * 2 * 5), config['mic']['rate'])
+
+    device = manager.create_device("onju-test", "127.0.0.1")
+    device.vad.is_speech = lambda data, rms, zcr: True # the user talking over the response
+
+    job = ResponseJob(device, "What's the weather like?")
+    job.playback = device.send_audio("response.wav", mic_timeout=10, listen=True)
+    device.job = job
+    assert fake_device.wait_for(0xAA)
+    assert fake_device.headers[0][5] & 0x01, "firmware should be asked to keep the mic open during playback"
+
+    threading.Thread(target=listen_detect, args=(None, manager, Startup(), config), daemon=True).start()
+    noise = np.random.default_rng(0).integers(-3000, 3000, config['mic']['chunk'], dtype=np.int16).tobytes()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _ in range(60):
+            s.sendto(noise, (config['udp']['ip'], config['udp']['port']))
+            time.sleep(0.005)
+
+    assert job.cancelled.wait(3)
+    assert fake_device.wait_for(0xEE), "device should be told to stop playing"
+    assert job.playback.done.wait(3)
+
+class SlowLLM:
+    """Answers each question once its gate is opened, like an HTTP request that can't be aborted."""
+    def __init__(self):
+        self.gates = {}
+
+    def askGPT(self, device, question, job=None):
+        device.add_message({"role": "user", "content": question})
+        self.gates.setdefault(question, threading.Event()).wait()
+        if job:
+            job.check()
+        device.add_message({"role": "assistant", "content": f"Answer to {question}"})
+        return f"Answer to {question}"
+
+class NoTTS:
+    def text_to_speech(self, device, text, path_name=None, job=None):
+        return None
+
+def test_cancelled_job_does_not_corrupt_next_jobs_history(config, manager):
+    device = manager.create_device("onju-test", "127.0.0.1")
+    llm = SlowLLM()
+    llm.gates["second"] = threading.Event()
+    llm.gates["second"].set() # the new request returns before the stale one
+
+    first = ResponseJob(device, "first")
+    device.job = first
+    threading.Thread(target=respond, args=(first, NoTTS(), llm, config), daemon=True).start()
+    while len(device.messages) < 2:
+        time.sleep(0.01)
+
+    device.cancel_response("new request")
+    second = ResponseJob(device, "second", previous=first)
+    device.job = second
+    threading.Thread(target=respond, args=(second, NoTTS(), llm, config), daemon=True).start()
+    time.sleep(0.1)
+    llm.gates["first"].set() # stale response arrives late
+
+    assert second.done.wait(3)
+    expected = [("user", "second"), ("assistant", "Answer to second")]
+    assert [(m['role'], m['content']) for m in device.messages[1:]] == expected
+    assert [(m['role'], m['content']) for m in manager.store.load_messages("onju-test")] == expected
+
+def test_mic_only_kept_open_while_thinking_with_barge_in(config, fake_device, manager):
+    device = manager.create_device("onju-test", "127.0.0.1")
+    llm = SlowLLM()
+    for enabled, question, timeout in [(False, "first", 0), (True, "second", config['barge_in']['thinking_mic_timeout'])]:
+        config['barge_in']['enabled'] = enabled
+        llm.gates[question] = threading.Event()
+        llm.gates[question].set()
+        job = ResponseJob(device, question)
+        respond(job, NoTTS(), llm, config)
+        assert job.done.is_set()
+
+        assert fake_device.wait_for(0xDD)
+        header = fake_device.headers.pop()
+        assert (header[0], header[1] << 8 | header[2]) == (0xDD, timeout)
+
+def test_cancel_does_not_block_caller(tmp_path, config, fake_device, manager):
+    audio.write_wav(str(tmp_path / "response.wav"), bytes(config['mic']['rate'] * 2 * 5), config['mic']['rate'])
+    device = manager.create_device("onju-test", "127.0.0.1")
+    job = ResponseJob(device, "What's the weather like?")
+    job.playback = device.send_audio("response.wav", listen=True)
+    device.job = job
+    assert fake_device.wait_for(0xAA)
+
+    device.ip_address = "10.255.255.1" # unreachable, a blocking connect would stall the UDP thread
+    tic = time.time()
+    device.cancel_response("new speech")
+    assert time.time() - tic < 0.05
+    assert job.playback.done.wait(5)
+
+def stream_mic(config, frames):
+    # sent at the pace the device records at
+    chunk = config['mic']['chunk']
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for i in range(0, len(frames) - chunk, chunk):
+            s.sendto(frames[i:i + chunk].tobytes(), (config['udp']['ip'], config['udp']['port']))
+            time.sleep(chunk / config['mic']['rate'])
+
+def play_and_listen(tmp_path, config, fake_device, manager, response):
+    config['barge_in']['enabled'] = True
+    audio.write_wav(str(tmp_path / "response.wav"), response.tobytes(), config['mic']['rate'])
+    device = manager.create_device("onju-test", "127.0.0.1")
+    job = ResponseJob(device, "Tell me a story")
+    job.playback = device.send_audio("response.wav", mic_timeout=10, listen=True)
+    device.job = job
+    assert fake_device.wait_for(0xAA)
+    threading.Thread(target=listen_detect, args=(None, manager, Startup(), config), daemon=True).start()
+    return device, job
+
+def test_own_speech_during_playback_does_not_cancel(tmp_path, config, fake_device, manager):
+    response = voiced(2.5)
+    device, job = play_and_listen(tmp_path, config, fake_device, manager, response)
+
+    echo = (response * 0.4).astype(np.int16) # what the mic picks up from the speaker
+    stream_mic(config, np.concatenate([echo, (voiced(0.5) * 0.1).astype(np.int16)])) # then the quieter tail as the device's buffer drains
+
+    assert not job.cancelled.is_set()
+    assert not device.vad.recording
+    assert len(device.vad.pre_buffer) == 0 # echo isn't kept to be prepended to the next recording
+
+def test_user_louder_than_echo_cancels(tmp_path, config, fake_device, manager):
+    response = voiced(3)
+    device, job = play_and_listen(tmp_path, config, fake_device, manager, response)
+
+    echo = (response * 0.4).astype(np.int16)
+    user = np.zeros_like(echo)
+    user[len(user) // 3:] = voiced(2, f0=220, amplitude=16000)[:len(user) - len(user) // 3]
+    stream_mic(config, np.clip(echo.astype(np.int32) + user, -32768, 32767).astype(np.int16))
+
+    assert job.cancelled.wait(1)
+
+def test_echo_gate_covers_playback_tail(config):
+    gate = EchoGate(config)
+    rate = config['mic']['rate']
+    now = time.monotonic()
+    chunk = voiced(0.04).tobytes()
+    for i in range(25): # one second of audio, sent ahead of when it plays
+        gate.played(now + i * 0.04, chunk)
+    end = now + 1.0
+
+    assert gate.is_echo(1000, now) # learning the coupling at the start of playback
+    for t in np.arange(now + 0.6, end, 0.03):
+        assert gate.is_echo(0.4 * 4000, t)
+    assert gate.active(end + config['barge_in']['echo_tail'] - 0.05) # device may still be playing its buffer
+    assert not gate.active(end + config['barge_in']['echo_tail'] + 0.05)
+    assert not gate.is_echo(1000, end + config['barge_in']['echo_tail'] + 0.05)
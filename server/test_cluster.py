@@ -0,0 +1,49 @@
+import json
+import socket
+import threading
+
+import fire
+
+from cluster import Frontend, owner, worker_control
+from conftest import free_port
+
+def test_owner_only_moves_devices_of_dead_worker():
+    workers = ["10.0.0.1:3100", "10.0.0.2:3100", "10.0.0.3:3100"]
+    hostnames = [f"onju-{i}" for i in range(50)]
+    before = {h: owner(h, workers) for h in hostnames}
+    after = {h: owner(h, workers[1:]) for h in hostnames}
+    assert all(after[h] == before[h] for h in hostnames if before[h] != workers[0])
+    assert all(after[h] != workers[0] for h in hostnames)
+
+def test_worker_contacts_devices_it_gains(config, fake_device, manager):
+    config['udp']['port'] = free_port(socket.SOCK_DGRAM) # worker control messages use port + 1
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as frontend:
+        frontend.bind(("127.0.0.1", 0))
+        frontend.settimeout(3)
+        config['cluster']['frontend'] = "127.0.0.1"
+        config['cluster']['control_port'] = frontend.getsockname()[1]
+        threading.Thread(target=worker_control, args=(manager, config), daemon=True).start()
+
+        data, addr = frontend.recvfrom(65536)
+        assert json.loads(data)['type'] == 'heartbeat'
+        # as sent by rebalance() when the device's previous worker stops responding, no greeting
+        msg = {'type': 'assignments', 'devices': {'onju-test': "127.0.0.1"}, 'greet': None}
+        frontend.sendto(json.dumps(msg).encode(), addr)
+
+        assert fake_device.wait_for(0xCC), "device should be contacted so it streams audio to the new worker"
+        assert not fake_device.wait_for(0xAA, timeout=0.2)
+        assert "onju-test" in manager.devices
+
+def test_local_workers_get_command_line_overrides(config):
+    config['cluster']['control_port'] = free_port(socket.SOCK_DGRAM)
+    overrides = {'role': 'frontend', 'mocks': True, 'mb': False, 'whisper': "small.en", 'voice': "Rachel", 'max_messages': 20, 'ha': None}
+    frontend = Frontend(config, overrides)
+    try:
+        cmd = frontend.worker_command(3100)
+    finally:
+        frontend.control.close()
+
+    # as the worker's main() would receive them
+    kwargs = fire.Fire(lambda **kwargs: kwargs, command=cmd[2:])
+    assert kwargs == {'role': 'worker', 'worker_port': 3100, 'frontend': "127.0.0.1",
+                      'mocks': True, 'mb': False, 'whisper': "small.en", 'voice': "Rachel", 'max_messages': 20}
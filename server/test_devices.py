@@ -0,0 +1,55 @@
+from devices import count_tokens
+
+def chars(tokens):
+    return "x" * (tokens * 4)
+
+def test_under_budget_keeps_everything(manager):
+    device = manager.create_device("onju-test", "127.0.0.1")
+    device.add_message({"role": "user", "content": "hi"})
+    device.add_message({"role": "assistant", "content": "hello"})
+    assert device.prune_messages() == []
+    assert len(device.messages) == 3
+
+def test_older_function_results_are_truncated_first(config, manager):
+    config['llm']['max_function_tokens'] = 10
+    device = manager.create_device("onju-test", "127.0.0.1")
+    for i in range(2):
+        device.add_message({"role": "assistant", "content": None, "function_call": {"name": "get_messages", "arguments": "{}"}})
+        device.add_message({"role": "function", "name": "get_messages", "content": chars(100)})
+
+    assert device.prune_messages() == []
+    assert len(device.messages[2]['content']) < 100 # older result truncated
+    assert device.messages[4]['content'] == chars(100) # latest kept whole while within budget
+    assert manager.store.load_messages("onju-test") == device.messages[1:]
+
+def test_oldest_messages_dropped_to_fit_token_budget(config, manager):
+    config['llm']['max_history_tokens'] = 100
+    config['llm']['max_function_tokens'] = 1000 # nothing to truncate, only dropping
+    device = manager.create_device("onju-test", "127.0.0.1")
+    device.add_message({"role": "assistant", "content": None, "function_call": {"name": "get_notes", "arguments": "{}"}})
+    device.add_message({"role": "function", "name": "get_notes", "content": chars(40)})
+    device.add_message({"role": "user", "content": chars(30)})
+    device.add_message({"role": "assistant", "content": chars(30)})
+
+    summarized = []
+    dropped = device.prune_messages(summarize=lambda d, messages: summarized.extend(messages))
+    # dropping the function call also drops its result, rather than leaving it first in history
+    assert [m['role'] for m in dropped] == ["assistant", "function"]
+    assert summarized == dropped
+    assert device.history_tokens() <= 100
+    assert [m['role'] for m in device.messages] == ["system", "user", "assistant"]
+    assert manager.store.load_messages("onju-test") == device.messages[1:]
+
+def test_max_messages_cap(config, manager):
+    config['llm']['max_messages'] = 5
+    device = manager.create_device("onju-test", "127.0.0.1")
+    for i in range(6):
+        device.add_message({"role": "user" if i % 2 == 0 else "assistant", "content": str(i)})
+    dropped = device.prune_messages()
+    assert [m['content'] for m in dropped] == ["0", "1"]
+    assert len(device.messages) == 5
+
+def test_count_tokens_includes_function_calls():
+    plain = count_tokens({"role": "assistant", "content": None})
+    call = count_tokens({"role": "assistant", "content": None, "function_call": {"name": "get_notes", "arguments": chars(10)}})
+    assert call > plain + 10
@@ -0,0 +1,23 @@
+import time
+
+import numpy as np
+
+def test_held_open_stream_is_fed_silence_without_underruns(config, fake_device, manager):
+    rate = config['mic']['rate']
+    device = manager.create_device("onju-test", "127.0.0.1")
+    filler = np.full(int(0.3 * rate), 1000, dtype=np.int16).tobytes()
+    response = np.full(int(0.3 * rate), 2000, dtype=np.int16).tobytes()
+
+    tic = time.monotonic()
+    playback = manager.downlink.play(device, bytes([0xaa, 0, 10, 13, 10, 0]), filler, finish=False)
+    time.sleep(1.0) # response still being generated
+    playback.feed(response).finish()
+    assert playback.done.wait(3)
+
+    assert playback.underruns == 0
+    received = np.frombuffer(bytes(fake_device.audio), dtype=np.int16)
+    assert received[:len(filler) // 2].tolist() == [1000] * (len(filler) // 2)
+    assert received[-len(response) // 2:].tolist() == [2000] * (len(response) // 2)
+    gap = received[len(filler) // 2:-len(response) // 2]
+    assert not gap.any() and len(gap) / rate > 1.0 - config['downlink']['lead_seconds'] - 0.1 # gap was filled with silence
+    assert len(received) / rate < time.monotonic() - tic + config['downlink']['lead_seconds'] # and never far ahead
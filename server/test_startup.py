@@ -0,0 +1,28 @@
+import time
+
+from startup import Startup
+
+def slow(value, seconds=0.05):
+    time.sleep(seconds)
+    return value
+
+def broken():
+    raise RuntimeError("voices endpoint unavailable")
+
+def test_ready_once_every_component_has_started():
+    startup = Startup()
+    startup.start({'a': (slow, (1,)), 'b': (slow, (2, 0.1))})
+    assert startup.get('a') == 1
+    assert startup.ready.wait(1)
+    assert not startup.failed.is_set()
+    assert startup.is_ready('b')
+
+def test_failed_component_is_reported_not_ready():
+    startup = Startup()
+    startup.start({'a': (slow, (1, 0.2)), 'tts': (broken, ())})
+    assert startup.failed.wait(1)
+    assert startup.failures == ['tts']
+    assert not startup.is_ready('tts')
+    startup.get('a')
+    time.sleep(0.05)
+    assert not startup.ready.is_set()
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from devices import Device, DeviceManager
+from store import StateStore
+
+def test_import_json_round_trips_voice_summary_and_messages(tmp_path, config):
+    messages = [
+        {"role": "system", "content": "old prompt"},
+        {"role": "user", "content": "Turn on the lights"},
+        {"role": "assistant", "content": "Done!"},
+    ]
+    with open(config['devices_file'], 'w') as f:
+        json.dump({'onju-coral': {
+            'hostname': 'onju-coral', 'ip_address': "10.0.0.7", 'messages': messages, 'voice': "Rachel", 'summary': "Likes warm light",
+        }}, f)
+
+    store = StateStore(config)
+    try:
+        store.import_json(config['devices_file'])
+        device = Device.from_dict(store.load_device('onju-coral'), config, store=store)
+        assert (device.ip_address, device.voice, device.summary) == ("10.0.0.7", "Rachel", "Likes warm light")
+        assert device.messages[1:] == messages[1:]
+        assert "Likes warm light" in device.messages[0]['content'] # system prompt rebuilt from config with the summary
+    finally:
+        store.close()
+
+def test_export_then_import_into_new_store(tmp_path, config, manager):
+    device = manager.create_device("onju-coral", "10.0.0.7")
+    device.voice = "Rachel"
+    device.set_summary("Likes warm light")
+    device.add_message({"role": "user", "content": "Turn on the lights"})
+    device.add_message({"role": "assistant", "content": "Done!"})
+    exported = manager.save_to_json(str(tmp_path / "export.json"))
+    assert exported['devices'] == 1
+
+    config = dict(config, state_db=str(tmp_path / "new.db"), devices_file=exported['file'])
+    restored = DeviceManager(config)
+    try:
+        copy = restored.devices["onju-coral"]
+        assert (copy.voice, copy.summary) == ("Rachel", "Likes warm light")
+        assert copy.messages[1:] == device.messages[1:]
+    finally:
+        restored.close()
+
+def test_failed_import_rolls_back(tmp_path, config):
+    with open(config['devices_file'], 'w') as f:
+        json.dump({
+            'onju-coral': {'ip_address': "10.0.0.7", 'messages': [{"role": "system", "content": ""}, {"role": "user", "content": "Hi"}]},
+            'onju-broken': {'messages': []}, # no ip_address
+        }, f)
+
+    store = StateStore(config)
+    try:
+        with pytest.raises(KeyError):
+            store.import_json(config['devices_file'])
+        assert not store.conn.in_transaction
+        assert store.is_empty() # nothing half imported
+
+        store.save_device(Device("onju-test", "10.0.0.8", config, store=store))
+        store.append_message("onju-test", {"role": "user", "content": "Still saved"})
+        other = sqlite3.connect(config['state_db'])
+        assert other.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1
+        other.close()
+    finally:
+        store.close()
+
+def test_concurrent_imports_only_import_once(tmp_path, config):
+    messages = [{"role": "system", "content": ""}] + [{"role": "user", "content": f"Message {i}"} for i in range(200)]
+    with open(config['devices_file'], 'w') as f:
+        json.dump({f'onju-{i}': {'ip_address': f"10.0.0.{i}", 'messages': messages} for i in range(20)}, f)
+
+    # like local cluster workers starting at the same time on an empty store
+    stores = [StateStore(config) for _ in range(4)]
+    try:
+        barrier = threading.Barrier(len(stores))
+        results = []
+        def run(store):
+            barrier.wait()
+            results.append(store.import_json(config['devices_file']))
+        threads = [threading.Thread(target=run, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(stores[0].load_messages('onju-3')) == 200
+        assert sorted(results) == [False, False, False, True]
+    finally:
+        for store in stores:
+            store.close()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from server import transcribe_segment
+
+class FakeWhisper:
+    """Records what it was asked to decode and answers with one segment covering the audio."""
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, initial_prompt=None):
+        self.calls.append((len(audio), initial_prompt))
+        text = f" Heard {len(self.calls)}."
+        return {'text': text, 'segments': [{'id': 0, 'start': 0.0, 'end': len(audio) / 16000, 'text': text, 'no_speech_prob': 0.1}]}
+
+def segment(start, end, text):
+    return {'id': 0, 'start': start, 'end': end, 'text': text, 'no_speech_prob': 0.1}
+
+@pytest.fixture
+def device(manager):
+    device = manager.create_device("onju-test", "127.0.0.1")
+    device.last_response = "Sure, what time?"
+    return device
+
+def test_partial_reused_when_final_is_the_same_audio(config, device):
+    model = FakeWhisper()
+    data = np.zeros(3 * 16000, dtype=np.int16)
+    partial = transcribe_segment(model, device, data, False, "utt-1", config)
+    final = transcribe_segment(model, device, data, True, "utt-1", config)
+    assert final is partial
+    assert len(model.calls) == 1
+    assert device.partial is None
+
+def test_only_tail_after_stable_segments_is_decoded(config, device):
+    model = FakeWhisper()
+    rate = config['mic']['rate']
+    stable = [segment(0.0, 1.2, " Set a timer"), segment(1.2, 2.5, " for ten")]
+    device.partial = {'id': "utt-1", 'samples': 3 * rate, 'res': {'text': " Set a timer for ten min", 'segments': stable + [segment(2.5, 3.0, " min")]}}
+
+    data = np.zeros(4 * rate, dtype=np.int16)
+    res = transcribe_segment(model, device, data, True, "utt-1", config)
+    assert model.calls == [(len(data) - int(2.5 * rate), "Sure, what time? Set a timer for ten")]
+    assert res['text'] == "Set a timer for ten Heard 1."
+    assert res['segments'][:2] == stable
+
+    device.last_response = None # e.g. the first utterance, only the partial's text is the prompt
+    device.partial = {'id': "utt-2", 'samples': 3 * rate, 'res': {'text': "", 'segments': stable + [segment(2.5, 3.0, " min")]}}
+    transcribe_segment(model, device, data, True, "utt-2", config)
+    assert model.calls[-1] == (len(data) - int(2.5 * rate), "Set a timer for ten")
+
+@pytest.mark.parametrize('partial_id, segments', [
+    ("utt-1", [segment(0.0, 3.0, " Set a timer for ten")]), # one segment may end mid-word, nothing is stable
+    ("utt-0", [segment(0.0, 1.2, " Set a timer"), segment(1.2, 3.0, " for ten")]), # from an earlier utterance
+])
+def test_full_transcription_without_a_usable_partial(config, device, partial_id, segments):
+    model = FakeWhisper()
+    rate = config['mic']['rate']
+    device.partial = {'id': partial_id, 'samples': 3 * rate, 'res': {'text': "", 'segments': segments}}
+
+    data = np.zeros(4 * rate, dtype=np.int16)
+    res = transcribe_segment(model, device, data, True, "utt-1", config)
+    assert model.calls == [(len(data), "Sure, what time?")]
+    assert res['text'] == " Heard 1."
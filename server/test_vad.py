@@ -0,0 +1,71 @@
+import numpy as np
+
+from conftest import voiced
+from devices import Vad, frame_energy
+
+class CountingVad:
+    """Wraps webrtcvad to count the frames that get past the pregate."""
+    def __init__(self, vad):
+        self.vad = vad
+        self.calls = 0
+
+    def is_speech(self, data, rate):
+        self.calls += 1
+        return self.vad.is_speech(data, rate)
+
+def make_vad(config):
+    vad = Vad(config)
+    vad.vad = CountingVad(vad.vad)
+    return vad
+
+def feed(vad, config, samples):
+    chunk = config['mic']['chunk']
+    frames = samples[:len(samples) // chunk * chunk].reshape(-1, chunk)
+    rms, zcr = frame_energy(frames)
+    return [vad.is_speech(frame.tobytes(), rms[i], zcr[i]) for i, frame in enumerate(frames)]
+
+def noise(seconds, level, seed=0):
+    return np.random.default_rng(seed).normal(0, level, int(seconds * 16000)).astype(np.int16)
+
+def test_silence_never_reaches_webrtcvad(config):
+    vad = make_vad(config)
+    results = feed(vad, config, noise(2, 10)) # well below min_rms
+    assert not any(results)
+    assert vad.vad.calls == 0
+    assert vad.skipped_frames == len(results)
+
+def test_speech_above_adapted_noise_floor_reaches_webrtcvad(config):
+    vad = make_vad(config)
+    feed(vad, config, noise(4, 300)) # noisy room, webrtcvad says it isn't speech so the floor follows it
+    assert 200 < vad.noise_floor < 400
+
+    calls = vad.vad.calls
+    assert not any(feed(vad, config, noise(1, 300, seed=1)))
+    assert vad.vad.calls - calls < 5, "background at the adapted floor should mostly be skipped"
+
+    calls = vad.vad.calls
+    speech = feed(vad, config, voiced(1) + noise(1, 300, seed=2))
+    assert vad.vad.calls - calls == len(speech)
+    assert np.mean(speech) > 0.8
+
+def test_quiet_speech_below_margin_is_missed(config):
+    # the trade-off of the pregate's margin: speech not clearly above the background is skipped as noise
+    quiet = (voiced(1) * 0.12).astype(np.int16) + noise(1, 300, seed=1)
+    vad = make_vad(config)
+    feed(vad, config, noise(4, 300))
+    assert not any(feed(vad, config, quiet))
+
+    config['vad']['pregate']['enabled'] = False
+    assert np.mean(feed(make_vad(config), config, quiet)) > 0.4 # webrtcvad alone would have heard some of it
+
+def test_hiss_rejected_by_zero_crossing_rate(config):
+    vad = make_vad(config)
+    threshold = config['vad']['pregate']['min_rms']
+    hiss = np.diff(np.random.default_rng(0).normal(0, 1, 16001)) # high-passed white noise, crosses zero on most samples
+    hiss = (hiss / np.sqrt(np.mean(hiss ** 2)) * 1.5 * threshold).astype(np.int16) # above the threshold, but not 2x
+
+    chunk = config['mic']['chunk']
+    _, zcr = frame_energy(hiss[:len(hiss) // chunk * chunk].reshape(-1, chunk))
+    assert zcr.min() > config['vad']['pregate']['max_zcr']
+    assert not any(feed(vad, config, hiss))
+    assert vad.vad.calls == 0